@@ -0,0 +1,118 @@
+import datetime
+import itertools
+import json
+import random
+from typing import List, Optional
+
+from team_submitter.models import SERVERS
+
+# 模拟go-cqhttp上报的事件，按场景生成请求体
+# 同一个种子总是生成同样的事件序列，便于前后对比
+
+# 各场景的事件比例：(事件类型, 权重)
+SCENARIOS = {
+    # 普通聊天、私聊和心跳，全部应该被快速过滤
+    "chat": [("chat", 90), ("private", 5), ("heartbeat", 5)],
+    # 查询列表、翻页和查看队伍详情
+    "query": [("list", 50), ("list_server", 20), ("list_page", 10), ("detail", 20)],
+    # 同一个队伍在短时间内被大量成员抢着加入，大部分会因为满员失败
+    "join": [("join_burst", 100)],
+    # 许多群同时创建队伍
+    "create": [("create", 100)],
+    # 接近真实的混合流量：以聊天为主，夹杂各种命令
+    "mixed": [("chat", 75), ("heartbeat", 3), ("list", 8), ("detail", 4),
+              ("join_burst", 5), ("create", 3), ("leave", 1), ("delete", 1)],
+}
+
+CHAT_MESSAGES = ["哈哈哈", "今天的活动谁打了", "[CQ:face,id=178]", "有人一起打协力吗",
+                 "这首歌好难", "[CQ:image,file=abc.image]", "晚上好", "车了车了"]
+
+
+class EventGenerator:
+    def __init__(self, seed: int = 1, groups: int = 50, users: int = 2000):
+        self.random = random.Random(seed)
+        self.groups = [str(100000 + i) for i in range(groups)]
+        self.users = [str(200000 + i) for i in range(users)]
+        self.message_ids = itertools.count(1)
+        # 预先创建的队伍：队伍ID -> 群ID，队伍ID按创建顺序从1开始
+        self.teams: List[str] = []
+        self._burst_team: Optional[int] = None
+        self._burst_left = 0
+
+    def _group_message(self, group_id: str, user_id: str, text: str) -> bytes:
+        return json.dumps({
+            "post_type": "message",
+            "message_type": "group",
+            "sub_type": "normal",
+            "time": int(datetime.datetime.now().timestamp()),
+            "self_id": 10000,
+            "message_id": next(self.message_ids),
+            "group_id": int(group_id),
+            "user_id": int(user_id),
+            "message": text,
+            "raw_message": text,
+            "font": 0,
+            "sender": {"user_id": int(user_id), "nickname": f"玩家{user_id[-4:]}", "card": "", "role": "member"},
+        }, ensure_ascii=False).encode("utf-8")
+
+    def _start_time(self) -> str:
+        # 使用完整格式的明天日期，避免在接近午夜运行时创建出已经开始的队伍
+        day = datetime.date.today() + datetime.timedelta(days=1)
+        return f"{day} {self.random.randint(0, 23):02d}:{self.random.choice(['00', '30'])}:00"
+
+    def _team_id(self) -> int:
+        return self.random.randint(1, max(1, len(self.teams)))
+
+    # 在每个群预先创建队伍，需要按顺序逐个发送，队伍ID才会与这里记录的一致
+    def setup_events(self, teams_per_group: int) -> List[bytes]:
+        events = []
+        for group_id in self.groups:
+            for _ in range(teams_per_group):
+                self.teams.append(group_id)
+                server = self.random.choice(SERVERS)
+                events.append(self._group_message(
+                    group_id, self.random.choice(self.users), f"车队 创建 {server} {self._start_time()}"))
+        return events
+
+    def scenario(self, name: str, count: int) -> List[bytes]:
+        kinds, weights = zip(*SCENARIOS[name])
+        return [self._event(kind) for kind in self.random.choices(kinds, weights, k=count)]
+
+    def _event(self, kind: str) -> bytes:
+        group_id = self.random.choice(self.groups)
+        user_id = self.random.choice(self.users)
+
+        if kind == "chat":
+            return self._group_message(group_id, user_id, self.random.choice(CHAT_MESSAGES))
+        if kind == "private":
+            return json.dumps({"post_type": "message", "message_type": "private", "user_id": int(user_id),
+                               "raw_message": "车队 查询", "message": "车队 查询"}, ensure_ascii=False).encode("utf-8")
+        if kind == "heartbeat":
+            return json.dumps({"post_type": "meta_event", "meta_event_type": "heartbeat", "self_id": 10000,
+                               "status": {"online": True, "good": True}, "interval": 5000}).encode("utf-8")
+        if kind == "list":
+            return self._group_message(group_id, user_id, "车队 查询")
+        if kind == "list_server":
+            return self._group_message(group_id, user_id, f"车队 查询 {self.random.choice(SERVERS)}")
+        if kind == "list_page":
+            return self._group_message(group_id, user_id, f"车队 查询 第{self.random.randint(1, 3)}页")
+        if kind == "detail":
+            team_id = self._team_id()
+            return self._group_message(self.teams[team_id - 1] if self.teams else group_id, user_id,
+                                       f"车队 查询 {team_id}")
+        if kind == "join_burst":
+            # 连续几十个事件都加入同一个队伍
+            if self._burst_left <= 0:
+                self._burst_team = self._team_id()
+                self._burst_left = self.random.randint(10, 40)
+            self._burst_left -= 1
+            group_id = self.teams[self._burst_team - 1] if self.teams else group_id
+            return self._group_message(group_id, user_id, f"车队 加入 {self._burst_team}")
+        if kind == "create":
+            return self._group_message(
+                group_id, user_id, f"车队 创建 {self.random.choice(SERVERS)} {self._start_time()}")
+        if kind == "leave":
+            return self._group_message(group_id, user_id, f"车队 退出 {self._team_id()}")
+        if kind == "delete":
+            return self._group_message(group_id, user_id, f"车队 删除 {self._team_id()}")
+        raise ValueError(f"未知的事件类型: {kind}")
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List, Optional
+
+# 以python -m benchmarks.handler运行时项目根目录已在sys.path中，直接运行脚本时需要手动加入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 命令分发的微基准：直接调用handle_team，数据库函数、定时提醒和发送队列都替换为立即返回的桩，
+# 只测命令解析、分发和回复拼接本身的开销，报告整体每秒处理的命令数以及每种命令的单次耗时
+#
+#   python -m benchmarks.handler                    # 默认的8种命令混合
+#   python -m benchmarks.handler -n 100000 --teams 10
+#   python -m benchmarks.handler --list-cache       # 队伍列表走回复缓存
+
+COMMAND_MIX = ["车队", "车队 查询", "车队 查询 1", "车队 加入 1", "车队 退出 1",
+               "车队 创建 日服 20:30", "车队 删除 1", "车队 未知"]
+
+
+# 把handler模块引用的数据库函数、定时提醒和发送函数替换为桩
+def install_stubs(handler, teams: List, list_cache: bool):
+    async def get_group_teams(group_id: str, server: Optional[str] = None, offset: int = 0, limit: int = 10):
+        matched = [team for team in teams if server is None or team.server == server]
+        return matched[offset:offset + limit], len(matched)
+
+    async def get_group_version(group_id: str):
+        # 返回固定的版本号时列表回复总是命中缓存，返回None时每次重新渲染
+        return (1, 0) if list_cache else None
+
+    async def get_team(team_id: int):
+        return teams[0]
+
+    async def change_membership(team_id: int, *args):
+        return True, "成功"
+
+    async def create_team(team):
+        return 1
+
+    async def cancel_team_notification(start_time: int):
+        pass
+
+    handler.get_group_teams = get_group_teams
+    handler.get_group_version = get_group_version
+    handler.get_team = get_team
+    handler.join_team = change_membership
+    handler.leave_team = change_membership
+    handler.delete_team = change_membership
+    handler.create_team = create_team
+    handler.schedule_team_notification = lambda *args: None
+    handler.cancel_team_notification = cancel_team_notification
+    handler.enqueue_group_message = lambda *args: None
+
+
+async def throughput(handle_team, messages: List, count: int) -> float:
+    started = time.perf_counter()
+    for i in range(count):
+        await handle_team(messages[i % len(messages)])
+    return count / (time.perf_counter() - started)
+
+
+async def main(args):
+    # 配置在导入时读取：关闭限流，否则同一个用户的命令很快就会被忽略
+    os.environ["RATE_LIMIT_USER"] = "0"
+    os.environ["RATE_LIMIT_GROUP"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from team_submitter import handler
+    from team_submitter.models import QQMessage, Team, TeamMember
+
+    now = int(time.time())
+    teams = [Team(id=i, creator_id=str(200000 + i), creator_name=f"玩家{i}", start_time=now + 3600,
+                  group_id="100000", server="日服", members=[TeamMember(str(200000 + i), f"玩家{i}")])
+             for i in range(1, args.teams + 1)]
+    install_stubs(handler, teams, args.list_cache)
+
+    messages = [QQMessage(group_id="100000", user_id="200001", message=text, sender={"nickname": "玩家"})
+                for text in COMMAND_MIX]
+
+    # 预热一轮，取三次运行的中位数
+    await throughput(handler.handle_team, messages, min(args.events, 2000))
+    rates = sorted([await throughput(handler.handle_team, messages, args.events) for _ in range(3)])
+    print(f"== {len(COMMAND_MIX)} 种命令混合, {args.events} 次调用, 队伍列表 {args.teams} 个队伍"
+          f"{'（回复缓存）' if args.list_cache else ''}")
+    print(f"   吞吐量 {rates[1]:>12.0f} 命令/秒")
+
+    repeat = max(1, args.events // len(COMMAND_MIX))
+    for message in messages:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await handler.handle_team(message)
+        print(f"   {message.message:<20} {(time.perf_counter() - started) / repeat * 1e6:>8.2f} us")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="handle_team命令分发微基准")
+    parser.add_argument("-n", "--events", type=int, default=20000, help="每次运行的调用次数")
+    parser.add_argument("--teams", type=int, default=5, help="队伍列表中的队伍数")
+    parser.add_argument("--list-cache", action="store_true", help="队伍列表走回复缓存")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import collections
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+# 以python -m benchmarks.join_stress运行时项目根目录已在sys.path中，直接运行脚本时需要手动加入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 并发加入压力测试：同时向同一个队伍发起几百次join_team（包含重复的用户），
+# 检查成员数从不超过TEAM_CAPACITY、成功加入的次数恰好是空余的名额数、缓存与数据库一致；不满足时以非0状态退出
+# 同一进程内的写操作由连接池的写锁串行执行，测不出进程间的竞争，
+# 默认把加入分给多个工作进程，每个进程有自己的连接池，同时对同一个数据库文件发起加入
+#
+#   python -m benchmarks.join_stress                   # 4个进程，10轮，每轮共300次并发加入
+#   python -m benchmarks.join_stress -p 8 -n 1000      # 指定进程数和每轮的加入次数
+#   python -m benchmarks.join_stress -p 1              # 只在当前进程内并发
+
+
+async def run_round(team_id: int, joins: int, users: int, seed: int) -> dict:
+    from team_submitter.database import join_team
+    from team_submitter.models import TeamMember
+
+    rng = random.Random(seed)
+    # 用户数少于加入次数，同一个用户会被并发加入多次
+    members = [TeamMember(str(300000 + n), f"玩家{n}") for n in (rng.randrange(users) for _ in range(joins))]
+    results = await asyncio.gather(*(join_team(team_id, member) for member in members))
+    return {
+        "successes": sum(1 for success, _ in results if success),
+        "messages": collections.Counter(msg for _, msg in results),
+    }
+
+
+# 工作进程共用的栅栏，所有进程打开连接池后同时开始加入
+_barrier = None
+
+
+def _init_worker(barrier):
+    global _barrier
+    _barrier = barrier
+
+
+async def _worker_round(team_id: int, joins: int, users: int, seed: int) -> dict:
+    from team_submitter.database import close_db, init_db
+
+    await init_db()
+    try:
+        _barrier.wait()
+        started = time.perf_counter()
+        result = await run_round(team_id, joins, users, seed)
+        result["elapsed"] = time.perf_counter() - started
+        return result
+    finally:
+        await close_db()
+
+
+def _worker(team_id: int, joins: int, users: int, seed: int) -> dict:
+    return asyncio.run(_worker_round(team_id, joins, users, seed))
+
+
+# 把一轮的加入分给多个工作进程，汇总各进程的结果
+def run_round_processes(team_id: int, joins: int, users: int, seed: int, processes: int) -> dict:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(processes)
+    tasks = [(team_id, joins // processes + (i < joins % processes), users, seed * 1000 + i) for i in range(processes)]
+    with context.Pool(processes, initializer=_init_worker, initargs=(barrier,)) as workers:
+        results = workers.starmap(_worker, tasks)
+    return {
+        "elapsed": max(result["elapsed"] for result in results),
+        "successes": sum(result["successes"] for result in results),
+        "messages": sum((result["messages"] for result in results), collections.Counter()),
+    }
+
+
+async def main(args) -> bool:
+    # 配置在导入时读取，必须在导入数据库模块之前设置
+    workdir = tempfile.mkdtemp(prefix="pjsk-stress-")
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "stress.db")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("MAX_OPEN_TEAMS_PER_CREATOR", "0")
+    # 多进程时按多进程部署检查缓存，读取前发现其他进程的修改会重新加载
+    os.environ["WORKERS"] = str(args.processes)
+
+    from team_submitter.database import close_db, create_team, get_team, init_db, pool
+    from team_submitter.models import Team
+    from utils.config import TEAM_CAPACITY
+    from utils.log import setup_logging, shutdown_logging
+
+    setup_logging()
+    await init_db()
+    ok = True
+    try:
+        for round_number in range(args.rounds):
+            team_id = await create_team(Team(
+                creator_id="1", creator_name="队长", start_time=int(time.time()) + 86400,
+                group_id="100000", server="日服"))
+
+            started = time.perf_counter()
+            # 多进程时只统计加入本身的耗时，不包括启动进程和打开连接池
+            if args.processes > 1:
+                result = await asyncio.to_thread(
+                    run_round_processes, team_id, args.joins, args.users, args.seed + round_number, args.processes)
+            else:
+                result = await run_round(team_id, args.joins, args.users, args.seed + round_number)
+            elapsed = result.get("elapsed", time.perf_counter() - started)
+
+            # 直接查数据库，不经过缓存
+            async with pool.reader() as db:
+                async with db.execute("SELECT COUNT(*) FROM team_members WHERE team_id = ?", (team_id,)) as cursor:
+                    count = (await cursor.fetchone())[0]
+
+            # 缓存中的成员必须与数据库一致
+            cached = len((await get_team(team_id)).members)
+            passed = count <= TEAM_CAPACITY and result["successes"] == TEAM_CAPACITY - 1 and cached == count
+            ok = ok and passed
+            print(f"第{round_number + 1}轮: {args.processes} 个进程 {args.joins} 次并发加入 {elapsed * 1000:.1f} ms, "
+                  f"成功 {result['successes']}, 成员数 {count}/{TEAM_CAPACITY}（缓存 {cached}）, "
+                  f"{dict(result['messages'])} {'通过' if passed else '失败'}")
+    finally:
+        await close_db()
+        shutdown_logging()
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="并发加入同一队伍的压力测试")
+    parser.add_argument("-p", "--processes", type=int, default=4, help="同时加入的工作进程数，1表示只在当前进程内并发")
+    parser.add_argument("-n", "--joins", type=int, default=300, help="每轮同时发起的加入次数（所有进程合计）")
+    parser.add_argument("-r", "--rounds", type=int, default=10, help="轮数，每轮使用一个新队伍")
+    parser.add_argument("--users", type=int, default=200, help="参与加入的不同用户数，少于加入次数时会有重复加入")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main(parse_args())) else 1)
@@ -0,0 +1,119 @@
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+# 以python -m benchmarks.models运行时项目根目录已在sys.path中，直接运行脚本时需要手动加入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from team_submitter.database import TEAM_WITH_MEMBERS_SQL, _group_team_rows  # noqa: E402
+
+# 对比从查询结果构造队伍列表的开销：原先的pydantic模型与现在的slots dataclass
+# 报告构造耗时（取多次运行的最小值）和构造结果常驻的内存
+#
+#   python -m benchmarks.models                     # 1000个队伍，每队5人
+#   python -m benchmarks.models --teams 5000 -m 5   # 指定队伍数和每队人数
+
+
+# 原先的pydantic模型，作为对比基线
+class PydanticMember(BaseModel):
+    qq_id: str
+    nickname: str
+
+
+class PydanticTeam(BaseModel):
+    id: Optional[int] = None
+    creator_id: str
+    creator_name: str
+    start_time: int
+    members: List[PydanticMember] = []
+    created_at: Optional[int] = None
+    group_id: Optional[str] = None
+    server: str = "日服"
+    notified_at: Optional[int] = None
+
+
+# 原先的构造方式：先按队伍聚合成字典，再逐个交给pydantic校验
+def build_pydantic(rows) -> List[PydanticTeam]:
+    teams = []
+    current = None
+    for row in rows:
+        if current is None or current['id'] != row['id']:
+            current = {
+                'id': row['id'], 'creator_id': row['creator_id'], 'creator_name': row['creator_name'],
+                'start_time': row['start_time'], 'created_at': row['created_at'], 'group_id': row['group_id'],
+                'server': row['server'], 'notified_at': row['notified_at'], 'members': [],
+            }
+            teams.append(current)
+        if row['member_qq_id'] is not None:
+            current['members'].append({'qq_id': row['member_qq_id'], 'nickname': row['member_nickname']})
+    return [PydanticTeam(**team) for team in teams]
+
+
+# 在内存数据库中生成队伍和成员，返回与线上相同的联合查询结果
+def make_rows(teams: int, members: int):
+    db = sqlite3.connect(":memory:")
+    db.row_factory = sqlite3.Row
+    db.executescript("""
+        CREATE TABLE teams (id INTEGER PRIMARY KEY, creator_id TEXT, creator_name TEXT, start_time INTEGER,
+                            created_at INTEGER, group_id TEXT, server TEXT, notified_at INTEGER);
+        CREATE TABLE team_members (id INTEGER PRIMARY KEY, team_id INTEGER, qq_id TEXT, nickname TEXT);
+    """)
+    now = int(time.time())
+    db.executemany(
+        "INSERT INTO teams VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+        [(i, str(200000 + i), f"玩家{i}", now + i * 60, now, str(100000 + i % 50), "日服")
+         for i in range(1, teams + 1)])
+    db.executemany(
+        "INSERT INTO team_members (team_id, qq_id, nickname) VALUES (?, ?, ?)",
+        [(i, str(200000 + i * members + j), f"玩家{i}-{j}") for i in range(1, teams + 1) for j in range(members)])
+    rows = db.execute(TEAM_WITH_MEMBERS_SQL + " ORDER BY t.id, m.id").fetchall()
+    db.close()
+    return rows
+
+
+def measure(build, rows, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        build(rows)
+        best = min(best, time.perf_counter() - started)
+
+    # 只统计构造结果本身占用的内存，查询结果在开始前已经存在
+    gc.collect()
+    tracemalloc.start()
+    result = build(rows)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return best, retained
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="队伍模型构造开销对比")
+    parser.add_argument("--teams", type=int, default=1000, help="队伍数")
+    parser.add_argument("-m", "--members", type=int, default=5, help="每个队伍的成员数")
+    parser.add_argument("-r", "--repeat", type=int, default=20, help="重复次数，耗时取最小值")
+    args = parser.parse_args(argv)
+
+    rows = make_rows(args.teams, args.members)
+    print(f"== {args.teams} 个队伍，每队 {args.members} 人（{len(rows)} 行查询结果）")
+    results = {}
+    for name, build in (("pydantic", build_pydantic), ("slots", _group_team_rows)):
+        seconds, retained = measure(build, rows, args.repeat)
+        results[name] = (seconds, retained)
+        print(f"   {name:<9} 构造 {seconds * 1000:>8.3f} ms   内存 {retained / 1024:>8.1f} KiB")
+
+    (old_seconds, old_bytes), (new_seconds, new_bytes) = results["pydantic"], results["slots"]
+    print(f"   slots相对pydantic：耗时 {new_seconds / old_seconds:.2f}x，内存 {new_bytes / old_bytes:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# 以python -m benchmarks.queries运行时项目根目录已在sys.path中，直接运行脚本时需要手动加入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run import SQLCounter  # noqa: E402
+
+# 按队伍数扫描读取队伍的查询次数和耗时：get_all_teams（绕过缓存，直接读数据库）和get_upcoming_teams
+# 队伍和成员一次联合查询读出，每次调用的查询次数不随队伍数增长
+#
+#   python -m benchmarks.queries                          # 10、100、500、1000个队伍
+#   python -m benchmarks.queries --teams 100 1000 5000 -m 5
+
+
+async def measure(function, args, sql: SQLCounter, repeat: int):
+    sql.reset()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await function(*args)
+    elapsed = (time.perf_counter() - started) / repeat
+    return sum(sql.counts.values()) / repeat, elapsed
+
+
+async def main(args):
+    # 配置在导入时读取，必须在导入数据库模块之前设置
+    workdir = tempfile.mkdtemp(prefix="pjsk-queries-")
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "queries.db")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from team_submitter.database import close_db, get_all_teams, get_upcoming_teams, init_db, pool, team_cache
+    from utils.log import setup_logging, shutdown_logging
+
+    setup_logging()
+    await init_db()
+    # 清空缓存后get_all_teams退回到数据库查询
+    team_cache.clear()
+    sql = SQLCounter()
+    await pool.set_trace_callback(sql)
+
+    now = int(time.time())
+    created = 0
+    print(f"== 每个队伍 {args.members} 名成员, 每项取 {args.repeat} 次调用的平均值")
+    print(f"   {'队伍数':>6} {'函数':<20} {'查询数':>6} {'耗时':>10}")
+    try:
+        for count in sorted(args.teams):
+            # 补齐到count个队伍，开始时间都落在get_upcoming_teams的查询范围内
+            async with pool.writer() as db:
+                for i in range(created, count):
+                    cursor = await db.execute(
+                        "INSERT INTO teams (creator_id, creator_name, start_time, created_at, group_id, server) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (str(200000 + i), f"玩家{i}", now + i, now, str(100000 + i % 50), "日服"))
+                    await db.executemany(
+                        "INSERT INTO team_members (team_id, qq_id, nickname) VALUES (?, ?, ?)",
+                        [(cursor.lastrowid, f"{i}-{j}", f"成员{j}") for j in range(args.members)])
+                await db.commit()
+            created = count
+
+            for function, call_args in ((get_all_teams, ()), (get_upcoming_teams, (now - 1, now + count))):
+                queries, seconds = await measure(function, call_args, sql, args.repeat)
+                print(f"   {count:>6} {function.__name__:<20} {queries:>6.0f} {seconds * 1000:>8.2f} ms")
+    finally:
+        await pool.set_trace_callback(None)
+        await close_db()
+        shutdown_logging()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="读取队伍的查询次数和耗时随队伍数的变化")
+    parser.add_argument("--teams", type=int, nargs="+", default=[10, 100, 500, 1000], help="要测量的队伍数")
+    parser.add_argument("-m", "--members", type=int, default=4, help="每个队伍的成员数")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="每项的调用次数")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import collections
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 以python -m benchmarks.run运行时项目根目录已在sys.path中，直接运行脚本时需要手动加入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.events import SCENARIOS, EventGenerator  # noqa: E402
+from benchmarks.stub_cqhttp import StubCQHTTP  # noqa: E402
+
+# 基准测试：在进程内直接通过ASGI调用routes.py中的app，回复发到本地的go-cqhttp替身
+# 每个场景报告吞吐量、延迟分位数、SQL语句数、数据库函数调用次数和对go-cqhttp的调用次数
+#
+#   python -m benchmarks.run                          # 运行所有场景
+#   python -m benchmarks.run -s mixed -n 20000 -c 64  # 指定场景、事件数和并发数
+#   python -m benchmarks.run --save base.json         # 保存结果作为基线
+#   python -m benchmarks.run --compare base.json      # 与基线对比
+
+
+# 不经过网络，直接按ASGI协议调用应用，返回(状态码, 响应体)
+async def asgi_post(app, path: str, body: bytes) -> Tuple[int, bytes]:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 5120),
+    }
+    sent = False
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+# 统计所有连接执行的SQL语句，按语句类型（SELECT、INSERT...）分类
+class SQLCounter:
+    def __init__(self):
+        self.counts: Dict[str, int] = collections.Counter()
+
+    def __call__(self, statement: str):
+        self.counts[statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"] += 1
+
+    def reset(self):
+        self.counts = collections.Counter()
+
+
+async def run_scenario(app, name: str, events: List[bytes], concurrency: int,
+                       stub: StubCQHTTP, sql: SQLCounter) -> dict:
+    from utils.metrics import DB_CALL_SECONDS
+    from utils.outbox import outbox
+
+    stub.reset()
+    sql.reset()
+    db_calls_before = DB_CALL_SECONDS.counts()
+    latencies: List[float] = []
+    statuses: Dict[int, int] = collections.Counter()
+    queue = collections.deque(events)
+
+    async def client():
+        while queue:
+            body = queue.popleft()
+            started = time.perf_counter()
+            status, _ = await asgi_post(app, "/event", body)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    # 等待发送队列把回复发完，再统计对go-cqhttp的调用
+    drained = await outbox.drain(timeout=60)
+
+    latencies.sort()
+    db_calls = {
+        labels[0]: count - db_calls_before.get(labels, 0)
+        for labels, count in DB_CALL_SECONDS.counts().items()
+        if count - db_calls_before.get(labels, 0)
+    }
+    return {
+        "scenario": name,
+        "events": len(events),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(events) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "sql_statements": sum(sql.counts.values()),
+        "sql_per_event": round(sum(sql.counts.values()) / len(events), 4),
+        "sql_by_type": dict(sorted(sql.counts.items())),
+        "db_calls": dict(sorted(db_calls.items())),
+        "outbound_calls": len(stub.calls),
+        "outbound_per_event": round(len(stub.calls) / len(events), 4),
+        "outbound_failures": stub.failures,
+        "outbox_drained": drained,
+    }
+
+
+def print_result(result: dict, baseline: Optional[dict] = None):
+    def delta(key: str, higher_is_better: bool) -> str:
+        if not baseline or not baseline.get(key):
+            return ""
+        change = (result[key] - baseline[key]) / baseline[key] * 100
+        better = change > 0 if higher_is_better else change < 0
+        return f" ({change:+.1f}%{'' if abs(change) < 1 else ' 好' if better else ' 差'})"
+
+    events = result["events"]
+    print(f"== {result['scenario']}: {events} 个事件, 并发 {result['concurrency']}")
+    print(f"   吞吐量    {result['throughput']:>10.1f} 事件/秒{delta('throughput', True)}")
+    for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms"):
+        print(f"   {key[:-3]:<9} {result[key]:>10.3f} ms{delta(key, False)}")
+    print(f"   SQL语句   {result['sql_statements']:>10d} ({result['sql_per_event']:.3f}/事件)"
+          f"{delta('sql_per_event', False)}  {result['sql_by_type']}")
+    print(f"   发送调用  {result['outbound_calls']:>10d} ({result['outbound_per_event']:.3f}/事件)"
+          f"{delta('outbound_per_event', False)}  失败 {result['outbound_failures']}"
+          f"{'' if result['outbox_drained'] else '  (发送队列未在60秒内发完)'}")
+    print(f"   响应状态  {result['statuses']}")
+    print(f"   数据库调用 {result['db_calls']}")
+
+
+async def main(args):
+    stub = StubCQHTTP(latency=args.stub_latency / 1000, fail_every=args.stub_fail_every)
+    await stub.start()
+
+    # 配置在导入时读取，必须在导入应用之前设置；已经设置的环境变量优先
+    workdir = tempfile.mkdtemp(prefix="pjsk-bench-")
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["CQHTTP_API_URL"] = stub.url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # 默认放开按群限速，否则发送队列要花很久才能发完，统计不到全部发送调用
+    os.environ.setdefault("OUTBOX_GROUP_RATE", "1000")
+    os.environ.setdefault("OUTBOX_GROUP_BURST", "1000")
+    # 事件生成器会让同一个用户和群在短时间内发很多命令，默认关闭命令限流和开队数上限
+    os.environ.setdefault("RATE_LIMIT_USER", "0")
+    os.environ.setdefault("RATE_LIMIT_GROUP", "0")
+    os.environ.setdefault("MAX_OPEN_TEAMS_PER_CREATOR", "0")
+    if args.quick_reply:
+        os.environ["QUICK_REPLY"] = "true"
+
+    from routes import app
+    from team_submitter.database import close_db, init_db, pool
+    from utils.log import setup_logging, shutdown_logging
+    from utils.outbox import outbox
+    from utils.sender import close_sender, init_sender
+
+    setup_logging()
+    await init_db()
+    await init_sender()
+    outbox.start()
+    sql = SQLCounter()
+    await pool.set_trace_callback(sql)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {result["scenario"]: result for result in json.load(f)["results"]}
+
+    results = []
+    try:
+        generator = EventGenerator(seed=args.seed, groups=args.groups, users=args.users)
+        # 预先创建队伍，按顺序发送保证队伍ID与生成器记录的一致
+        await run_scenario(app, "setup", generator.setup_events(args.teams_per_group), 1, stub, sql)
+
+        names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+        for name in names:
+            result = await run_scenario(app, name, generator.scenario(name, args.events),
+                                        args.concurrency, stub, sql)
+            results.append(result)
+            if not args.json:
+                print_result(result, baseline.get(name))
+    finally:
+        await pool.set_trace_callback(None)
+        await outbox.stop()
+        await close_sender()
+        await close_db()
+        await stub.stop()
+        shutdown_logging()
+
+    report = {"args": vars(args), "results": results}
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="车队机器人基准测试")
+    parser.add_argument("-s", "--scenario", default="all", choices=["all", *SCENARIOS], help="要运行的场景")
+    parser.add_argument("-n", "--events", type=int, default=5000, help="每个场景的事件数")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="同时处理的事件数")
+    parser.add_argument("--groups", type=int, default=50, help="模拟的群数量")
+    parser.add_argument("--users", type=int, default=2000, help="模拟的用户数量")
+    parser.add_argument("--teams-per-group", type=int, default=5, help="每个群预先创建的队伍数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子，相同的种子生成相同的事件")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="go-cqhttp替身每次调用的延迟（毫秒）")
+    parser.add_argument("--stub-fail-every", type=int, default=0, help="go-cqhttp替身每隔多少次调用返回一次失败")
+    parser.add_argument("--quick-reply", action="store_true", help="开启QUICK_REPLY模式")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    parser.add_argument("--save", help="把结果保存到文件，作为之后对比的基线")
+    parser.add_argument("--compare", help="与之前保存的基线对比")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import time
+from typing import List, Optional, Set, Tuple
+
+# 最小的go-cqhttp HTTP API替身：只实现send_group_msg，记录每次调用
+# 直接基于asyncio实现HTTP/1.1（支持keep-alive），不依赖其他服务器，开销远小于被测应用
+
+
+class StubCQHTTP:
+    def __init__(self, latency: float = 0.0, fail_every: int = 0):
+        # 每次调用的模拟延迟（秒），以及每隔多少次返回一次失败（0表示从不失败）
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls: List[Tuple[float, object, str]] = []  # (时间, 群ID, 消息内容)
+        self.failures = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    # 在随机端口上启动
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # 客户端可能还保持着长连接，直接结束这些连接
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def reset(self):
+        self.calls = []
+        self.failures = 0
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+
+                status, payload = await self._handle(request_line.split(" ")[1], body)
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # 连接断开或替身停止，连接任务就此结束
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _handle(self, path: str, body: bytes):
+        if path != "/send_group_msg":
+            return "404 Not Found", {"status": "failed", "retcode": 404}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = json.loads(body or b"{}")
+        self.calls.append((time.perf_counter(), params.get("group_id"), params.get("message", "")))
+        if self.fail_every and len(self.calls) % self.fail_every == 0:
+            self.failures += 1
+            return "200 OK", {"status": "failed", "retcode": 100}
+        return "200 OK", {"status": "ok", "retcode": 0, "data": {"message_id": len(self.calls)}}
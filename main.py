@@ -1,19 +1,18 @@
 import uvicorn
 
 from routes import app
-from team_submitter.database import init_db
-from team_submitter.scheduler import init_scheduler
+from utils.config import WORKERS
+from utils.log import setup_logging
+
+# 业务日志通过队列异步输出，在应用启动前配置
+# 应用的启动和关闭钩子注册在routes.py中
+setup_logging()
+
 
 # 主函数
 if __name__ == "__main__":
-    # 在应用启动时初始化数据库和调度器
-    @app.on_event("startup")
-    async def startup_event():
-        # 初始化数据库
-        await init_db()
-        
-        # 初始化并启动调度器
-        init_scheduler()
-    
-    # 启动FastAPI应用
-    uvicorn.run(app, host="0.0.0.0", port=5120)
\ No newline at end of file
+    # 启动FastAPI应用，多个工作进程时uvicorn需要通过导入字符串加载应用
+    if WORKERS > 1:
+        uvicorn.run("routes:app", host="0.0.0.0", port=5120, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=5120)
@@ -1,47 +1,297 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
+from typing import Optional, Tuple
 import json
 import httpx
 import asyncio
+import time
+
+# orjson解析速度更快，未安装时退回标准库
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 from team_submitter.models import QQMessage, TeamMember, Team
 from team_submitter.database import get_all_teams, get_team, join_team, delete_team, create_team, delete_team_by_id, leave_team
-from team_submitter.handler import handle_team
+from team_submitter.database import claim_event, close_db, init_db, release_event
+from team_submitter.handler import command_label, handle_team, rate_limited
+from team_submitter.scheduler import init_scheduler, shutdown_scheduler
+from utils.config import (EVENT_DEDUP_PERSIST, EVENT_DEDUP_SIZE, EVENT_DEDUP_TTL, ONEBOT_ACCESS_TOKEN,
+                          QUICK_REPLY)
+from utils.dedup import RecentEvents
+from utils.log import request_context, setup_logging, shutdown_logging
+from utils.metrics import DUPLICATE_EVENTS, EVENT_SECONDS, render_metrics
+from utils.outbox import outbox
+from utils.sender import close_sender, init_sender
+from utils.ws_transport import onebot_ws
 # 创建FastAPI应用
 app = FastAPI(title="QQ机器人")
 
-# API路由 - 处理go-cqhttp的消息推送
 
+# 在应用启动时初始化数据库和调度器
+# 钩子注册在本模块中：多进程部署时uvicorn以spawn方式启动工作进程，main.py会被执行两次，
+# 在那里注册会让每个钩子重复执行；本模块在每个进程中只导入一次
+@app.on_event("startup")
+async def startup_event():
+    # 业务日志通过队列异步输出（重复调用无效）
+    setup_logging()
+
+    # 初始化数据库
+    await init_db()
+
+    # 创建发送消息用的共享HTTP客户端
+    await init_sender()
+
+    # 启动后台发送队列
+    outbox.start()
+
+    # 启动调度器并参与选主，成为主进程后恢复尚未发送的开始提醒
+    await init_scheduler()
+
+# 在应用关闭时停止调度器并关闭数据库连接
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 先停止调度器并释放租约，避免任务在连接关闭后继续访问数据库
+    await shutdown_scheduler()
+
+    # 尽量发完队列中剩余的消息
+    await outbox.stop()
+
+    # 断开go-cqhttp的反向WebSocket连接
+    await onebot_ws.close()
+
+    # 关闭共享HTTP客户端和数据库连接池
+    await close_sender()
+    await close_db()
+
+    # 最后写完剩余的日志
+    shutdown_logging()
+
+# 命令前缀在请求体中可能出现的形式：UTF-8原文，或被转义为\uXXXX（大小写均有实现）
+PREFIX_MARKERS = ("车队".encode("utf-8"), b"\\u8f66\\u961f", b"\\u8F66\\u961F")
+
+# 忽略事件的固定响应体，跳过FastAPI的序列化
+IGNORED_NOT_GROUP = b'{"status":"ignored","reason":"not a group message"}'
+IGNORED_NO_GROUP_ID = b'{"status":"ignored","reason":"no group_id"}'
+IGNORED_NO_PREFIX = b'{"status":"ignored","reason":"no prefix"}'
+IGNORED_DUPLICATE = b'{"status":"ignored","reason":"duplicate"}'
+
+# 最近处理过的消息，go-cqhttp重复投递同一条消息时不再处理
+recent_events = RecentEvents(EVENT_DEDUP_SIZE, EVENT_DEDUP_TTL)
 
-@app.post("/event")
-async def receive_message(request: Request):
-    # 获取原始请求数据
-    data = await request.json()
+
+def _ignored(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+# 解析go-cqhttp上报的事件
+# 返回(消息对象, None)表示需要处理；返回(None, 忽略原因)表示可以忽略；JSON格式错误时抛出ValueError
+def parse_event(body: bytes) -> Tuple[Optional[QQMessage], Optional[bytes]]:
+    # 快速过滤：请求体中根本没有命令前缀时（普通聊天、心跳等）无需解析JSON
+    if not any(marker in body for marker in PREFIX_MARKERS):
+        return None, IGNORED_NO_PREFIX
+
+    data = json_loads(body)
 
     # 检查是否为群消息事件
-    if data.get("post_type") != "message" or data.get("message_type") != "group":
-        return {"status": "ignored", "reason": "not a group message"}
+    if not isinstance(data, dict) or data.get("post_type") != "message" or data.get("message_type") != "group":
+        return None, IGNORED_NOT_GROUP
+
+    # 前缀可能出现在昵称等其他字段中，构建消息对象前再确认一次
+    raw_message = data.get("raw_message", "")
+    if not isinstance(raw_message, str) or not raw_message.startswith("车队"):
+        return None, IGNORED_NO_PREFIX
 
     # 提取消息内容
     group_id = str(data.get("group_id", ""))
     user_id = str(data.get("user_id", ""))
-    raw_message = data.get("raw_message", "")
-    message_content = data.get("message", "")  # 可能包含CQ码的原始消息
     sender = data.get("sender", {})
 
+    # 只处理群消息
+    if not group_id:
+        return None, IGNORED_NO_GROUP_ID
+
+    message_id = data.get("message_id")
+
     # 构建QQ消息对象
     message = QQMessage(
         group_id=group_id,
         user_id=user_id,
         message=raw_message,
-        sender=sender
+        sender=sender,
+        message_id=str(message_id) if message_id is not None else None
     )
+    return message, None
 
-    # 只处理群消息
-    if not message.group_id:
-        return {"status": "ignored", "reason": "no group_id"}
 
-    # 检查消息前缀
-    if message.message.startswith("车队"):
-        return await handle_team(message)
+# 同一个群里同一条消息只处理一次；没有消息ID的事件无法判断，总是处理
+def _event_key(message: QQMessage) -> Optional[str]:
+    if message.message_id is None:
+        return None
+    return f"{message.group_id}:{message.message_id}"
+
+
+# 在内存中认领一个事件，返回False表示这是重复投递，不应再处理
+# pending是事件处理结果的Future，记在内存中供重复投递的事件取用
+def claim_recent(key: str, pending: Optional[asyncio.Future] = None) -> bool:
+    if not recent_events.claim(key, pending):
+        DUPLICATE_EVENTS.inc()
+        return False
+    return True
+
+
+# 开启持久化时再到数据库中认领已在内存中认领的事件，返回False表示其他进程已经处理过
+# 内存中已有的重复事件和被限流的事件不会走到这里，不访问数据库
+async def claim_persisted(key: str, pending: Optional[asyncio.Future] = None) -> bool:
+    if not EVENT_DEDUP_PERSIST:
+        return True
+
+    try:
+        claimed = await claim_event(key)
+    except BaseException:
+        # 数据库认领失败（例如数据库被锁）时撤销内存中的认领，go-cqhttp重试时可以重新处理
+        recent_events.release(key)
+        if pending is not None:
+            pending.set_result(None)
+        raise
+    if not claimed:
+        # 其他进程已经处理过，本进程拿不到它的处理结果
+        if pending is not None:
+            pending.set_result(None)
+        DUPLICATE_EVENTS.inc()
+        return False
+    return True
+
+
+# 处理失败时撤销认领，让go-cqhttp重新投递的事件可以再次处理
+async def release_message(key: str):
+    recent_events.release(key)
+    if EVENT_DEDUP_PERSIST:
+        await release_event(key)
+
+
+# 重复投递的事件：快速回复模式下回复只在第一次的HTTP响应中，go-cqhttp因为超时而重新投递时那次响应已经丢失，
+# 这里等第一次处理完成后返回同样的结果，由go-cqhttp再回复一次；回复通过发送队列发出时不重复回复
+async def _replay_result(key: str, quick_reply: bool) -> Optional[dict]:
+    if not quick_reply:
+        return None
+    pending = recent_events.get(key)
+    if pending is None:
+        return None
+    # 重复的请求被取消时不影响第一次的处理
+    return await asyncio.shield(pending)
+
+
+async def _handle_message(message: QQMessage, quick_reply: bool) -> Optional[dict]:
+    key = _event_key(message)
+    if key is None:
+        return rate_limited(message) or await handle_team(message, quick_reply=quick_reply)
+
+    pending = asyncio.get_running_loop().create_future() if quick_reply else None
+    if not claim_recent(key, pending):
+        return await _replay_result(key, quick_reply)
+
+    # 先查内存去重再限流，重复投递的事件不占用限流额度；限流又在持久化认领之前，被限流的事件不写数据库
+    # 被限流的事件仍记在内存中，重复投递时得到同样的忽略结果
+    limited = rate_limited(message)
+    if limited is not None:
+        if pending is not None:
+            pending.set_result(limited)
+        return limited
+
+    if not await claim_persisted(key, pending):
+        return await _replay_result(key, quick_reply)
+
+    result = None
+    try:
+        result = await handle_team(message, quick_reply=quick_reply)
+        return result
+    except Exception:
+        await release_message(key)
+        raise
+    finally:
+        # 处理失败时结果为None，等待中的重复事件按已忽略处理
+        if pending is not None:
+            pending.set_result(result)
+
+# API路由 - 处理go-cqhttp的消息推送
+
+
+@app.post("/event")
+async def receive_message(request: Request):
+    started = time.perf_counter()
+
+    # 获取原始请求数据
+    body = await request.body()
+
+    try:
+        message, ignored = parse_event(body)
+    except ValueError:
+        EVENT_SECONDS.observe(time.perf_counter() - started, "invalid")
+        raise HTTPException(status_code=400, detail="invalid json")
+
+    if message is None:
+        EVENT_SECONDS.observe(time.perf_counter() - started, "ignored")
+        return _ignored(ignored)
+
+    # 同一事件产生的日志带有相同的request_id
+    label = command_label(message)
+    try:
+        with request_context():
+            result = await _handle_message(message, QUICK_REPLY)
+    finally:
+        EVENT_SECONDS.observe(time.perf_counter() - started, label)
+
+    # 重复投递的事件：不处理；快速回复模式下返回第一次处理的结果，其他情况不回复
+    if result is None:
+        return _ignored(IGNORED_DUPLICATE)
+
+    # 快速回复模式：按OneBot快速操作格式返回，由go-cqhttp直接回复到群里
+    if QUICK_REPLY and result.get("status") == "ok" and result.get("message"):
+        return {"reply": result["message"], "auto_escape": False, "at_sender": False}
+
+    return result
+
+
+# 处理通过反向WebSocket收到的事件，回复通过发送队列发出
+def _on_ws_event(body: bytes):
+    try:
+        message, _ = parse_event(body)
+    except ValueError:
+        return None
+
+    if message is None:
+        return None
+    return _handle_ws_event(message)
+
+
+async def _handle_ws_event(message: QQMessage):
+    with request_context(), EVENT_SECONDS.time(command_label(message)):
+        return await _handle_message(message, False)
+
+
+# 反向WebSocket - go-cqhttp以Universal角色连接，事件和API调用共用这个连接
+@app.websocket("/ws")
+async def onebot_websocket(websocket: WebSocket):
+    # 校验access token，go-cqhttp通过Authorization头或access_token参数传递
+    if ONEBOT_ACCESS_TOKEN:
+        authorization = websocket.headers.get("authorization", "")
+        token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else authorization
+        token = token or websocket.query_params.get("access_token", "")
+        if token != ONEBOT_ACCESS_TOKEN:
+            await websocket.close(code=1008)
+            return
+
+    await onebot_ws.serve(websocket, _on_ws_event)
+
+
+# Prometheus指标 - 事件处理、数据库调用、消息发送和定时任务的耗时
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
 
-    return {"status": "ignored", "reason": "no prefix"}
\ No newline at end of file
+# 运行状态 - 发送队列深度和发送延迟
+@app.get("/stats")
+async def get_stats():
+    return {"outbox": outbox.stats(), "websocket_connected": onebot_ws.connected}
@@ -0,0 +1,138 @@
+import collections
+from typing import Dict, Iterable, List, Optional, OrderedDict, Tuple
+
+from team_submitter.models import Team, TeamMember
+
+
+# 进程内的队伍缓存，按队伍ID和群ID索引
+# 由database.py中的写操作在提交后同步更新，读命令直接从这里取数据
+# 返回的是缓存中的对象本身，调用方不要修改
+# 每个群有一个版本号，群里的队伍或成员变化时加一，用于判断根据队伍渲染的回复是否过期
+class TeamCache:
+    def __init__(self):
+        self.loaded = False
+        self.version: Optional[int] = None  # 缓存对应的team_changes计数
+        self._teams: Dict[int, Team] = {}
+        self._by_group: Dict[Optional[str], Dict[int, Team]] = {}
+        self._generation = 0  # 整体重新加载的次数，重新加载后所有群的版本号都会变化
+        self._group_versions: Dict[Optional[str], int] = {}
+
+    # 用数据库中的全部队伍替换缓存内容（在启动时调用）
+    def load(self, teams: Iterable[Team], version: Optional[int] = None):
+        self.version = version
+        self._teams = {}
+        self._by_group = {}
+        self._generation += 1
+        self._group_versions = {}
+        for team in sorted(teams, key=lambda t: t.id):
+            self._index(team)
+        self.loaded = True
+
+    def clear(self):
+        self.version = None
+        self._teams = {}
+        self._by_group = {}
+        self._generation += 1
+        self._group_versions = {}
+        self.loaded = False
+
+    # 群的当前版本号，缓存内容重新加载或群里的队伍有变化后都会不同
+    def group_version(self, group_id: Optional[str]) -> Tuple[int, int]:
+        return self._generation, self._group_versions.get(group_id, 0)
+
+    def _touch(self, group_id: Optional[str]):
+        self._group_versions[group_id] = self._group_versions.get(group_id, 0) + 1
+
+    def _index(self, team: Team):
+        self._teams[team.id] = team
+        self._by_group.setdefault(team.group_id, {})[team.id] = team
+        self._touch(team.group_id)
+
+    # 按队伍ID升序返回所有队伍
+    def all(self) -> List[Team]:
+        return list(self._teams.values())
+
+    def get(self, team_id: int) -> Optional[Team]:
+        return self._teams.get(team_id)
+
+    # 按队伍ID升序返回某个群的队伍
+    def by_group(self, group_id: Optional[str]) -> List[Team]:
+        return list(self._by_group.get(group_id, {}).values())
+
+    # 按队伍ID升序返回某个群的队伍，可按服务器过滤，并返回过滤后的总数
+    def page_by_group(self, group_id: Optional[str], server: Optional[str],
+                      offset: int, limit: int) -> Tuple[List[Team], int]:
+        teams = self._by_group.get(group_id, {}).values()
+        if server is not None:
+            teams = [team for team in teams if team.server == server]
+        else:
+            teams = list(teams)
+        return teams[offset:offset + limit], len(teams)
+
+    # 新建的队伍ID总是最大的，直接追加即可保持顺序
+    def put(self, team: Team):
+        self._index(team)
+
+    def remove(self, team_id: int) -> Optional[Team]:
+        team = self._teams.pop(team_id, None)
+        if team is not None:
+            group = self._by_group.get(team.group_id)
+            if group is not None:
+                group.pop(team_id, None)
+                if not group:
+                    del self._by_group[team.group_id]
+            self._touch(team.group_id)
+        return team
+
+    def add_member(self, team_id: int, member: TeamMember):
+        team = self._teams.get(team_id)
+        if team is not None:
+            team.members.append(member)
+            self._touch(team.group_id)
+
+    def remove_member(self, team_id: int, qq_id: str):
+        team = self._teams.get(team_id)
+        if team is not None:
+            team.members = [m for m in team.members if m.qq_id != qq_id]
+            self._touch(team.group_id)
+
+    def mark_notified(self, team_ids: Iterable[int], notified_at: int):
+        for team_id in team_ids:
+            team = self._teams.get(team_id)
+            if team is not None:
+                team.notified_at = notified_at
+
+
+# 渲染好的回复缓存，按群保存，记录渲染时群的版本号，版本号变化后自动失效
+# 最多保存maxsize条，超出时淘汰最久没有使用的
+class ReplyCache:
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = max(1, maxsize)
+        self._replies: OrderedDict[tuple, Tuple[Tuple[int, int], str]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._replies)
+
+    # 取出在version时渲染的回复，没有或已过期时返回None
+    def get(self, key: tuple, version: Tuple[int, int]) -> Optional[str]:
+        entry = self._replies.get(key)
+        if entry is None:
+            return None
+        if entry[0] != version:
+            del self._replies[key]
+            return None
+        self._replies.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: tuple, version: Tuple[int, int], reply: str):
+        self._replies[key] = (version, reply)
+        self._replies.move_to_end(key)
+        if len(self._replies) > self.maxsize:
+            self._replies.popitem(last=False)
+
+    def clear(self):
+        self._replies.clear()
+
+
+# 全局队伍缓存
+team_cache = TeamCache()
@@ -1,276 +1,458 @@
-import datetime
-import aiosqlite
+import contextlib
+import time
 from typing import List, Tuple, Optional
 
+from team_submitter.cache import team_cache
+from team_submitter.db_pool import ConnectionPool
+from team_submitter.migrations import run_migrations
 from team_submitter.models import Team, TeamMember
+from team_submitter.timeutil import now_ts
+from utils.config import DATABASE_PATH, DB_READER_POOL_SIZE, MAX_OPEN_TEAMS_PER_CREATOR, TEAM_CAPACITY, WORKERS
+from utils.log import get_logger
+from utils.metrics import ACTIVE_MEMBERS, ACTIVE_TEAMS, DB_CALL_SECONDS, timed
 
-# 数据库路径
-DATABASE_PATH = "teams.db"
+logger = get_logger("database")
+
+# 全局连接池，在init_db中打开，在close_db中关闭
+pool = ConnectionPool(DATABASE_PATH, DB_READER_POOL_SIZE)
+
+# 队伍数和成员数的指标直接从缓存统计，缓存未加载时不输出
+ACTIVE_TEAMS.set_function(lambda: len(team_cache.all()) if team_cache.loaded else None)
+ACTIVE_MEMBERS.set_function(
+    lambda: sum(len(team.members) for team in team_cache.all()) if team_cache.loaded else None)
 
 # 数据库初始化
 async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS teams (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            creator_id TEXT NOT NULL,
-            creator_name TEXT NOT NULL,
-            start_time TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            group_id TEXT,
-            server TEXT CHECK(server IN ('日服', '台服', '国际服', '国服')) NOT NULL
-        )
-        """)
-        
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS team_members (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            team_id INTEGER NOT NULL,
-            qq_id TEXT NOT NULL,
-            nickname TEXT NOT NULL,
-            FOREIGN KEY (team_id) REFERENCES teams (id) ON DELETE CASCADE
-        )
-        """)
-        
-        await db.commit()
+    await pool.open()
 
-# 获取所有队伍
-async def get_all_teams() -> List[Team]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        teams = []
-        
-        # 获取所有队伍
-        cursor = await db.execute("SELECT * FROM teams ORDER BY id")
-        team_rows = await cursor.fetchall()
-        
-        for team_row in team_rows:
-            # 获取队伍成员
-            member_cursor = await db.execute(
-                "SELECT qq_id, nickname FROM team_members WHERE team_id = ?", 
-                (team_row['id'],)
-            )
-            member_rows = await member_cursor.fetchall()
-            members = [TeamMember(qq_id=m['qq_id'], nickname=m['nickname']) for m in member_rows]
-            
-            team = Team(
-                id=team_row['id'],
-                creator_id=team_row['creator_id'],
-                creator_name=team_row['creator_name'],
-                start_time=team_row['start_time'],
-                created_at=team_row['created_at'],
-                group_id=team_row['group_id'],
-                server=team_row['server'],
-                members=members
+    # 建表并执行未完成的结构迁移
+    async with pool.writer() as db:
+        await run_migrations(db)
+
+    # 加载全部队伍到内存缓存
+    await _reload_cache()
+
+# 关闭数据库连接
+async def close_db():
+    await pool.close()
+    team_cache.clear()
+
+# 队伍及其成员的联合查询，每个成员一行，没有成员的队伍也会返回一行
+# {teams}是队伍的来源，可以是teams表，也可以是先在teams上筛选分页的子查询
+TEAM_WITH_MEMBERS_TEMPLATE = """
+SELECT t.id, t.creator_id, t.creator_name, t.start_time, t.created_at, t.group_id, t.server, t.notified_at,
+       m.qq_id AS member_qq_id, m.nickname AS member_nickname
+FROM {teams} t
+LEFT JOIN team_members m ON m.team_id = t.id
+"""
+
+TEAM_WITH_MEMBERS_SQL = TEAM_WITH_MEMBERS_TEMPLATE.format(teams="teams")
+
+# 某个群的一页队伍及其成员：先在teams上按群和服务器筛选并分页，再关联成员
+GROUP_TEAM_PAGE_SQL = TEAM_WITH_MEMBERS_TEMPLATE.format(
+    teams="(SELECT * FROM teams WHERE group_id = ? AND (? IS NULL OR server = ?) ORDER BY id LIMIT ? OFFSET ?)"
+) + " ORDER BY t.id, m.id"
+
+# 将联合查询的结果按队伍聚合，要求结果已按队伍ID排序
+def _group_team_rows(rows) -> List[Team]:
+    teams = []
+    current = None
+    for row in rows:
+        if current is None or current.id != row['id']:
+            current = Team(
+                id=row['id'],
+                creator_id=row['creator_id'],
+                creator_name=row['creator_name'],
+                start_time=row['start_time'],
+                created_at=row['created_at'],
+                group_id=row['group_id'],
+                server=row['server'],
+                notified_at=row['notified_at'],
             )
-            teams.append(team)
-            
-        return teams
+            teams.append(current)
+        if row['member_qq_id'] is not None:
+            current.members.append(TeamMember(row['member_qq_id'], row['member_nickname']))
+    return teams
 
-# 获取指定队伍
-async def get_team(team_id: int) -> Optional[Team]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        
-        # 获取队伍信息
-        cursor = await db.execute("SELECT * FROM teams WHERE id = ?", (team_id,))
-        team_row = await cursor.fetchone()
-        
-        if not team_row:
-            return None
-        
-        # 获取队伍成员
-        member_cursor = await db.execute(
-            "SELECT qq_id, nickname FROM team_members WHERE team_id = ?", 
-            (team_id,)
-        )
-        member_rows = await member_cursor.fetchall()
-        members = [TeamMember(qq_id=m['qq_id'], nickname=m['nickname']) for m in member_rows]
-        
-        team = Team(
-            id=team_row['id'],
-            creator_id=team_row['creator_id'],
-            creator_name=team_row['creator_name'],
-            start_time=team_row['start_time'],
-            created_at=team_row['created_at'],
-            group_id=team_row['group_id'],
-            server=team_row['server'],
-            members=members
+# 从数据库读取所有队伍
+async def _load_all_teams() -> List[Team]:
+    async with pool.reader() as db:
+        # 一次查询取出所有队伍和成员
+        cursor = await db.execute(TEAM_WITH_MEMBERS_SQL + " ORDER BY t.id, m.id")
+        rows = await cursor.fetchall()
+
+    return _group_team_rows(rows)
+
+# 读取队伍和成员的变更计数（由触发器维护，见migrations.py版本9）
+async def _team_changes(db) -> int:
+    async with db.execute("SELECT version FROM team_changes WHERE id = 1") as cursor:
+        return (await cursor.fetchone())[0]
+
+# 重新从数据库加载缓存，并记录此时的变更计数
+# 在写连接上读取，加载期间本进程的写操作不会插进来
+@timed(DB_CALL_SECONDS)
+async def _reload_cache():
+    async with pool.writer() as db:
+        version = await _team_changes(db)
+        cursor = await db.execute(TEAM_WITH_MEMBERS_SQL + " ORDER BY t.id, m.id")
+        rows = await cursor.fetchall()
+        team_cache.load(_group_team_rows(rows), version)
+
+# 多进程部署时，其他进程的写操作不会更新本进程的缓存
+# 读缓存前在只读连接上比较变更计数，发现其他进程修改过队伍就重新加载
+async def _ensure_cache_fresh():
+    if WORKERS > 1 and team_cache.loaded:
+        async with pool.reader() as db:
+            version = await _team_changes(db)
+        if version != team_cache.version:
+            await _reload_cache()
+
+# 修改队伍或成员的写事务
+# 多进程部署时在事务中读取修改前后的变更计数：修改前与缓存一致，说明期间没有其他进程的修改，
+# 调用方提交后会把本次修改写入缓存，直接记录修改后的计数，不必把自己的修改当成其他进程的修改重新加载
+@contextlib.asynccontextmanager
+async def _team_transaction():
+    async with pool.transaction() as db:
+        if WORKERS <= 1:
+            yield db
+            return
+        before = await _team_changes(db)
+        yield db
+        after = await _team_changes(db)
+    if before == team_cache.version:
+        team_cache.version = after
+
+# 获取所有队伍（缓存未加载时回退到数据库）
+@timed(DB_CALL_SECONDS)
+async def get_all_teams() -> List[Team]:
+    await _ensure_cache_fresh()
+    if team_cache.loaded:
+        return team_cache.all()
+    return await _load_all_teams()
+
+# 分页获取某个群的队伍，可按服务器过滤，返回(当前页队伍, 总数)
+@timed(DB_CALL_SECONDS)
+async def get_group_teams(group_id: str, server: Optional[str] = None,
+                          offset: int = 0, limit: int = 10) -> Tuple[List[Team], int]:
+    await _ensure_cache_fresh()
+    if team_cache.loaded:
+        return team_cache.page_by_group(group_id, server, offset, limit)
+
+    async with pool.reader() as db:
+        cursor = await db.execute(
+            "SELECT COUNT(*) FROM teams WHERE group_id = ? AND (? IS NULL OR server = ?)",
+            (group_id, server, server)
         )
-        
-        return team
+        total = (await cursor.fetchone())[0]
+
+        cursor = await db.execute(GROUP_TEAM_PAGE_SQL, (group_id, server, server, limit, offset))
+        rows = await cursor.fetchall()
+
+    return _group_team_rows(rows), total
+
+# 某个群的队伍版本号，群里的队伍有变化后会不同；缓存未加载时无法判断，返回None
+@timed(DB_CALL_SECONDS)
+async def get_group_version(group_id: str) -> Optional[Tuple[int, int]]:
+    await _ensure_cache_fresh()
+    if team_cache.loaded:
+        return team_cache.group_version(group_id)
+    return None
+
+# 获取指定队伍（缓存未加载时回退到数据库）
+@timed(DB_CALL_SECONDS)
+async def get_team(team_id: int) -> Optional[Team]:
+    await _ensure_cache_fresh()
+    if team_cache.loaded:
+        return team_cache.get(team_id)
+
+    async with pool.reader() as db:
+        cursor = await db.execute(TEAM_WITH_MEMBERS_SQL + " WHERE t.id = ? ORDER BY m.id", (team_id,))
+        rows = await cursor.fetchall()
+
+    teams = _group_team_rows(rows)
+    if not teams:
+        return None
+
+    return teams[0]
 
-# 创建队伍
-async def create_team(team: Team) -> int:
-    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+# 创建队伍，创建者尚未开始的队伍已达上限时不创建并返回None
+@timed(DB_CALL_SECONDS)
+async def create_team(team: Team) -> Optional[int]:
+    current_time = now_ts()
     
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # 创建队伍
+    async with _team_transaction() as db:
+        # 创建队伍，上限检查和插入在同一条语句中完成，多个进程同时创建也不会超出
         cursor = await db.execute(
-            "INSERT INTO teams (creator_id, creator_name, start_time, created_at, group_id, server) VALUES (?, ?, ?, ?, ?, ?)",
-            (team.creator_id, team.creator_name, team.start_time, current_time, team.group_id, team.server)
+            """
+            INSERT INTO teams (creator_id, creator_name, start_time, created_at, group_id, server)
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE ? <= 0
+               OR (SELECT COUNT(*) FROM teams WHERE creator_id = ? AND start_time > ?) < ?
+            """,
+            (team.creator_id, team.creator_name, team.start_time, current_time, team.group_id, team.server,
+             MAX_OPEN_TEAMS_PER_CREATOR, team.creator_id, current_time, MAX_OPEN_TEAMS_PER_CREATOR)
         )
-        # Ensure lastrowid is not None before returning
-        if cursor.lastrowid is None:
-            raise ValueError("Failed to create team: no ID was generated")
-            
-        team_id = cursor.lastrowid
-        
-        # 添加创建者作为第一个成员
-        await db.execute(
-            "INSERT INTO team_members (team_id, qq_id, nickname) VALUES (?, ?, ?)",
-            (team_id, team.creator_id, team.creator_name)
-        )
-        
-        await db.commit()
-        return team_id
+        team_id = cursor.lastrowid if cursor.rowcount == 1 else None
+
+        if team_id is not None:
+            # 添加创建者作为第一个成员
+            await db.execute(
+                "INSERT INTO team_members (team_id, qq_id, nickname) VALUES (?, ?, ?)",
+                (team_id, team.creator_id, team.creator_name)
+            )
+
+    if team_id is None:
+        logger.info("创建者尚未开始的队伍已达上限",
+                    extra={"user_id": team.creator_id, "group_id": team.group_id})
+        return None
+
+    # 事务提交后再写入缓存
+    team_cache.put(Team(
+        id=team_id,
+        creator_id=team.creator_id,
+        creator_name=team.creator_name,
+        start_time=team.start_time,
+        created_at=current_time,
+        group_id=team.group_id,
+        server=team.server,
+        members=[TeamMember(team.creator_id, team.creator_name)]
+    ))
+    return team_id
 
 # 加入队伍
+@timed(DB_CALL_SECONDS)
 async def join_team(team_id: int, member: TeamMember) -> Tuple[bool, str]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # 检查队伍是否存在
-        cursor = await db.execute("SELECT id FROM teams WHERE id = ?", (team_id,))
-        team = await cursor.fetchone()
-        if not team:
-            return False, "队伍不存在"
-        
-        # 检查成员是否已经在队伍中
-        cursor = await db.execute(
-            "SELECT id FROM team_members WHERE team_id = ? AND qq_id = ?", 
-            (team_id, member.qq_id)
-        )
-        existing_member = await cursor.fetchone()
-        if existing_member:
-            return False, "你已经在队伍中了"
-        
-        # 检查队伍是否已满
+    async with _team_transaction() as db:
+        # 队伍存在且未满时才插入，重复加入由唯一索引忽略
         cursor = await db.execute(
-            "SELECT COUNT(*) FROM team_members WHERE team_id = ?", 
-            (team_id,)
+            """
+            INSERT OR IGNORE INTO team_members (team_id, qq_id, nickname)
+            SELECT ?, ?, ?
+            WHERE EXISTS (SELECT 1 FROM teams WHERE id = ?)
+              AND (SELECT COUNT(*) FROM team_members WHERE team_id = ?) < ?
+            """,
+            (team_id, member.qq_id, member.nickname, team_id, team_id, TEAM_CAPACITY)
         )
-        count_row = await cursor.fetchone()
-        # Check if count_row exists and has a valid value
-        if count_row and count_row[0] >= 5:
-            return False, "队伍已满"
-        
-        # 添加成员
-        await db.execute(
-            "INSERT INTO team_members (team_id, qq_id, nickname) VALUES (?, ?, ?)",
-            (team_id, member.qq_id, member.nickname)
-        )
-        
-        await db.commit()
+        joined = cursor.rowcount == 1
+
+        # 插入失败时再查一次具体原因
+        if not joined:
+            cursor = await db.execute(
+                """
+                SELECT EXISTS (SELECT 1 FROM teams WHERE id = ?),
+                       EXISTS (SELECT 1 FROM team_members WHERE team_id = ? AND qq_id = ?)
+                """,
+                (team_id, team_id, member.qq_id)
+            )
+            team_exists, is_member = await cursor.fetchone()
+
+    # 事务提交后再更新缓存，提交前其他协程不会读到未提交的修改
+    if joined:
+        team_cache.add_member(team_id, TeamMember(member.qq_id, member.nickname))
         return True, "加入成功"
+    if not team_exists:
+        return False, "队伍不存在"
+    if is_member:
+        return False, "你已经在队伍中了"
+    return False, "队伍已满"
 
 # 删除队伍
+@timed(DB_CALL_SECONDS)
 async def delete_team(team_id: int, user_id: str) -> Tuple[bool, str]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # 检查队伍是否存在
-        cursor = await db.execute("SELECT creator_id FROM teams WHERE id = ?", (team_id,))
-        team = await cursor.fetchone()
-        if not team:
-            return False, "队伍不存在"
-        
-        # 检查是否是创建者
-        if team[0] != user_id:
-            return False, "只有创建者可以删除队伍"
-        
-        # 删除队伍
-        await db.execute("DELETE FROM teams WHERE id = ?", (team_id,))
-        await db.commit()
+    async with _team_transaction() as db:
+        # 只有创建者能删除，成员由外键级联删除
+        cursor = await db.execute(
+            "DELETE FROM teams WHERE id = ? AND creator_id = ?",
+            (team_id, user_id)
+        )
+        deleted = cursor.rowcount == 1
+
+        if not deleted:
+            cursor = await db.execute("SELECT 1 FROM teams WHERE id = ?", (team_id,))
+            team_exists = await cursor.fetchone() is not None
+
+    # 事务提交后再更新缓存
+    if deleted:
+        team_cache.remove(team_id)
         return True, "删除成功"
+    if not team_exists:
+        return False, "队伍不存在"
+    return False, "只有创建者可以删除队伍"
 
-# 删除过期队伍
-async def delete_expired_teams():
-    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("DELETE FROM teams WHERE start_time < ?", (current_time,))
-        await db.commit()
-    print(f"[{current_time}] 已删除过期队伍")
-
-# 获取即将开始的队伍
-async def get_upcoming_teams(start_time: str, end_time: str) -> List[dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        
-        # 获取即将开始的队伍
+# 删除开始时间早于before的队伍，每批最多batch_size个，每批单独提交，返回删除的队伍数
+# 批与批之间会释放写连接，其他写操作不必等待整个清理结束
+@timed(DB_CALL_SECONDS)
+async def delete_expired_teams(before: int, batch_size: int = 200) -> int:
+    removed = 0
+    while True:
+        async with _team_transaction() as db:
+            async with db.execute(
+                "SELECT id FROM teams WHERE start_time < ? ORDER BY start_time LIMIT ?",
+                (before, batch_size)
+            ) as cursor:
+                team_ids = [row['id'] for row in await cursor.fetchall()]
+            if team_ids:
+                placeholders = ",".join("?" * len(team_ids))
+                await db.execute(f"DELETE FROM teams WHERE id IN ({placeholders})", team_ids)
+        if not team_ids:
+            break
+
+        for team_id in team_ids:
+            team_cache.remove(team_id)
+
+        removed += len(team_ids)
+        if len(team_ids) < batch_size:
+            break
+
+    if removed:
+        logger.info("已删除过期队伍", extra={"before": before, "removed": removed})
+    return removed
+
+# 获取即将开始且尚未提醒的队伍
+@timed(DB_CALL_SECONDS)
+async def get_upcoming_teams(start_time: int, end_time: int) -> List[Team]:
+    async with pool.reader() as db:
+        # 一次查询取出时间范围内的队伍和成员
         cursor = await db.execute(
-            "SELECT * FROM teams WHERE start_time BETWEEN ? AND ?", 
+            TEAM_WITH_MEMBERS_SQL
+            + " WHERE t.start_time BETWEEN ? AND ? AND t.notified_at IS NULL ORDER BY t.id, m.id",
             (start_time, end_time)
         )
-        team_rows = await cursor.fetchall()
-        
-        teams = []
-        for team_row in team_rows:
-            # 获取队伍成员
-            member_cursor = await db.execute(
-                "SELECT qq_id, nickname FROM team_members WHERE team_id = ?",
-                (team_row['id'],)
-            )
-            member_rows = await member_cursor.fetchall()
-            members = [{'qq_id': m['qq_id'], 'nickname': m['nickname']} for m in member_rows]
-            
-            team = {
-                'id': team_row['id'],
-                'creator_id': team_row['creator_id'],
-                'creator_name': team_row['creator_name'],
-                'start_time': team_row['start_time'],
-                'created_at': team_row['created_at'],
-                'group_id': team_row['group_id'],
-                'server': team_row['server'],
-                'members': members
-            }
-            teams.append(team)
-            
-        return teams
-
-# 获取队伍成员
-async def get_team_members(team_id: int) -> List[dict]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        
+        rows = await cursor.fetchall()
+
+    return _group_team_rows(rows)
+
+# 获取所有尚未提醒的队伍的ID和开始时间（用于重建定时提醒）
+@timed(DB_CALL_SECONDS)
+async def get_pending_teams(since: int) -> List[Tuple[int, int]]:
+    async with pool.reader() as db:
         cursor = await db.execute(
-            "SELECT qq_id, nickname FROM team_members WHERE team_id = ?", 
-            (team_id,)
+            "SELECT id, start_time FROM teams WHERE notified_at IS NULL AND start_time >= ? ORDER BY start_time",
+            (since,)
         )
-        members = await cursor.fetchall()
-        return [dict(member) for member in members]
+        rows = await cursor.fetchall()
+        return [(row['id'], row['start_time']) for row in rows]
+
+# 是否还有在指定时间开始、尚未提醒的队伍（取消提醒前检查同一时间的提醒任务是否还需要保留）
+@timed(DB_CALL_SECONDS)
+async def has_pending_team_at(start_time: int) -> bool:
+    async with pool.reader() as db:
+        async with db.execute(
+            "SELECT EXISTS (SELECT 1 FROM teams WHERE start_time = ? AND notified_at IS NULL)", (start_time,)
+        ) as cursor:
+            return bool((await cursor.fetchone())[0])
+
+# 标记队伍已提醒，返回本次成功标记的队伍ID（已被标记过的不会重复返回）
+@timed(DB_CALL_SECONDS)
+async def mark_teams_notified(team_ids: List[int]) -> List[int]:
+    if not team_ids:
+        return []
+    current_time = now_ts()
+    placeholders = ",".join("?" * len(team_ids))
+
+    # 查询和更新在同一个写事务中，其他进程无法在两者之间标记同一个队伍
+    async with _team_transaction() as db:
+        async with db.execute(
+            f"SELECT id FROM teams WHERE id IN ({placeholders}) AND notified_at IS NULL", team_ids
+        ) as cursor:
+            claimed = [row['id'] for row in await cursor.fetchall()]
+        if claimed:
+            await db.execute(
+                f"UPDATE teams SET notified_at = ? WHERE id IN ({','.join('?' * len(claimed))})",
+                (current_time, *claimed)
+            )
+
+    # 事务提交后再更新缓存
+    team_cache.mark_notified(claimed, current_time)
+    return claimed
 
 # 退出队伍
+@timed(DB_CALL_SECONDS)
 async def leave_team(team_id: int, user_id: str) -> Tuple[bool, str]:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # 检查队伍是否存在
-        cursor = await db.execute("SELECT id FROM teams WHERE id = ?", (team_id,))
-        team = await cursor.fetchone()
-        if not team:
-            return False, "队伍不存在"
-        
-        # 检查用户是否在队伍中
+    async with _team_transaction() as db:
+        # 创建者不能退出；队伍不存在时子查询为NULL，不会删除任何记录
         cursor = await db.execute(
-            "SELECT id FROM team_members WHERE team_id = ? AND qq_id = ?", 
-            (team_id, user_id)
+            """
+            DELETE FROM team_members
+            WHERE team_id = ? AND qq_id = ?
+              AND qq_id != (SELECT creator_id FROM teams WHERE id = ?)
+            """,
+            (team_id, user_id, team_id)
         )
-        member = await cursor.fetchone()
-        if not member:
-            return False, "你不在这个队伍中"
-        
-        # 检查是否是创建者
-        cursor = await db.execute("SELECT creator_id FROM teams WHERE id = ?", (team_id,))
-        team_info = await cursor.fetchone()
-        if team_info and team_info[0] == user_id:
-            return False, "创建者不能退出队伍，请使用删除命令"
-        
-        # 删除成员
-        await db.execute(
-            "DELETE FROM team_members WHERE team_id = ? AND qq_id = ?",
-            (team_id, user_id)
-        )
-        
-        await db.commit()
+        left = cursor.rowcount == 1
+
+        # 删除失败时再查一次具体原因
+        if not left:
+            cursor = await db.execute(
+                """
+                SELECT creator_id,
+                       EXISTS (SELECT 1 FROM team_members WHERE team_id = ? AND qq_id = ?) AS is_member
+                FROM teams WHERE id = ?
+                """,
+                (team_id, user_id, team_id)
+            )
+            team = await cursor.fetchone()
+
+    # 事务提交后再更新缓存
+    if left:
+        team_cache.remove_member(team_id, user_id)
         return True, "退出成功"
+    if not team:
+        return False, "队伍不存在"
+    if not team['is_member']:
+        return False, "你不在这个队伍中"
+    return False, "创建者不能退出队伍，请使用删除命令"
 
 # 删除指定队伍
+@timed(DB_CALL_SECONDS)
 async def delete_team_by_id(team_id: int):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _team_transaction() as db:
         await db.execute("DELETE FROM teams WHERE id = ?", (team_id,))
-        await db.commit()
\ No newline at end of file
+    team_cache.remove(team_id)
+
+# 获取或续期调度器租约，租约过期后其他进程才能抢到，返回当前进程是否持有租约
+@timed(DB_CALL_SECONDS)
+async def try_acquire_lease(owner: str, ttl: float) -> bool:
+    now = time.time()
+    async with pool.transaction() as db:
+        cursor = await db.execute(
+            """
+            INSERT INTO scheduler_lease (id, owner, expires_at) VALUES (1, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE scheduler_lease.owner = excluded.owner OR scheduler_lease.expires_at < ?
+            """,
+            (owner, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+# 主动释放调度器租约（在进程退出时调用），其他进程可以立即接管
+@timed(DB_CALL_SECONDS)
+async def release_lease(owner: str):
+    async with pool.transaction() as db:
+        await db.execute("DELETE FROM scheduler_lease WHERE owner = ?", (owner,))
+
+# 记录一个事件已被处理，返回是否是第一次记录（其他进程已记录过时返回False）
+@timed(DB_CALL_SECONDS)
+async def claim_event(event_key: str) -> bool:
+    async with pool.writer() as db:
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO processed_events (event_key, seen_at) VALUES (?, ?)",
+            (event_key, now_ts())
+        )
+        await db.commit()
+        return cursor.rowcount == 1
+
+# 撤销事件的处理记录（处理失败时调用），重新投递的事件可以再次处理
+@timed(DB_CALL_SECONDS)
+async def release_event(event_key: str):
+    async with pool.writer() as db:
+        await db.execute("DELETE FROM processed_events WHERE event_key = ?", (event_key,))
+        await db.commit()
+
+# 删除早于before的事件记录，返回删除的条数
+@timed(DB_CALL_SECONDS)
+async def purge_processed_events(before: int) -> int:
+    async with pool.writer() as db:
+        cursor = await db.execute("DELETE FROM processed_events WHERE seen_at < ?", (before,))
+        await db.commit()
+        return cursor.rowcount
@@ -0,0 +1,128 @@
+import asyncio
+import contextlib
+from typing import AsyncIterator, Callable, List, Optional
+
+import aiosqlite
+
+# 每个连接打开后都要设置的PRAGMA
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",  # 让ON DELETE CASCADE生效
+    "PRAGMA synchronous = NORMAL",  # WAL模式下NORMAL已足够安全
+    "PRAGMA busy_timeout = 5000",  # 遇到锁时最多等待5秒而不是立即报错
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",  # 每个连接约8MB页缓存
+)
+
+
+# 长连接管理器：一个写连接 + 一组只读连接
+class ConnectionPool:
+    def __init__(self, path: str, reader_count: int = 4):
+        self.path = path
+        self.reader_count = max(1, reader_count)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock: Optional[asyncio.Lock] = None
+        self._readers: Optional[asyncio.Queue] = None
+        self._all_readers: List[aiosqlite.Connection] = []
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path)
+        conn.row_factory = aiosqlite.Row
+        for pragma in CONNECTION_PRAGMAS:
+            await self._pragma(conn, pragma)
+        return conn
+
+    # 执行PRAGMA并立即关闭游标，未关闭的游标会一直占用数据库锁
+    @staticmethod
+    async def _pragma(conn: aiosqlite.Connection, pragma: str):
+        async with conn.execute(pragma) as cursor:
+            await cursor.fetchall()
+
+    # 打开所有连接（在应用启动时调用）
+    async def open(self):
+        if self.is_open:
+            return
+
+        # 写连接负责开启WAL，WAL模式是持久化在数据库文件中的
+        writer = await self._connect()
+        await self._pragma(writer, "PRAGMA journal_mode = WAL")
+
+        readers = asyncio.Queue(maxsize=self.reader_count)
+        all_readers = []
+        try:
+            for _ in range(self.reader_count):
+                conn = await self._connect()
+                await self._pragma(conn, "PRAGMA query_only = ON")
+                all_readers.append(conn)
+                readers.put_nowait(conn)
+        except Exception:
+            for conn in all_readers:
+                await conn.close()
+            await writer.close()
+            raise
+
+        self._writer = writer
+        self._writer_lock = asyncio.Lock()
+        self._readers = readers
+        self._all_readers = all_readers
+
+    # 关闭所有连接（在应用关闭时调用）
+    async def close(self):
+        if not self.is_open:
+            return
+
+        # 等待正在进行的写操作完成
+        async with self._writer_lock:
+            writer, self._writer = self._writer, None
+            await writer.close()
+
+        readers, self._all_readers = self._all_readers, []
+        for conn in readers:
+            await conn.close()
+        self._readers = None
+
+    # 为所有连接设置SQL跟踪回调，每执行一条语句调用一次（基准测试用来统计语句数）
+    # 回调在aiosqlite的连接线程中执行，传入None取消
+    async def set_trace_callback(self, callback: Optional[Callable[[str], None]]):
+        if not self.is_open:
+            raise RuntimeError("数据库连接池尚未打开，请先调用init_db()")
+        for conn in [self._writer, *self._all_readers]:
+            await conn.set_trace_callback(callback)
+
+    # 借出一个只读连接，用完后自动归还
+    @contextlib.asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self.is_open:
+            raise RuntimeError("数据库连接池尚未打开，请先调用init_db()")
+
+        readers = self._readers
+        conn = await readers.get()
+        try:
+            yield conn
+        finally:
+            readers.put_nowait(conn)
+
+    # 独占写连接，同一时间只有一个协程在写；出错时自动回滚
+    @contextlib.asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self.is_open:
+            raise RuntimeError("数据库连接池尚未打开，请先调用init_db()")
+
+        async with self._writer_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    # 在写连接上开启BEGIN IMMEDIATE事务，立即拿到写锁，正常退出时提交
+    # 多个进程共享数据库时，检查和写入在同一个事务中完成，不会被其他进程插入
+    @contextlib.asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        async with self.writer() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            yield db
+            await db.commit()
@@ -1,131 +1,296 @@
-from team_submitter.database import create_team, delete_team, get_all_teams, get_team, join_team, leave_team
-from team_submitter.models import Team, TeamMember, QQMessage
-from utils.sender import send_group_message
+import re
+from typing import Awaitable, Callable, Dict, List, Optional
 
+from team_submitter.cache import ReplyCache
+from team_submitter.database import (create_team, delete_team, get_group_teams, get_group_version, get_team, join_team,
+                                     leave_team)
+from team_submitter.models import SERVERS, Team, TeamMember, QQMessage
+from team_submitter.scheduler import cancel_team_notification, schedule_team_notification
+from team_submitter.timeutil import format_local, parse_local, today_at
+from utils.config import (LIST_REPLY_CACHE_SIZE, MAX_OPEN_TEAMS_PER_CREATOR, RATE_LIMIT_GROUP, RATE_LIMIT_MAX_KEYS,
+                          RATE_LIMIT_USER, RATE_LIMIT_WINDOW, TEAM_CAPACITY, TEAM_PAGE_SIZE)
+from utils.log import get_logger
+from utils.metrics import RATE_LIMITED, REPLY_CACHE_TOTAL
+from utils.outbox import enqueue_group_message
+from utils.ratelimit import SlidingWindowLimiter
+
+logger = get_logger("handler")
+
+# 命令处理函数：接收消息和命令名之后的参数，返回回复内容
+CommandHandler = Callable[[QQMessage, str], Awaitable[str]]
+
+# 命令注册表：命令名 -> 处理函数
+COMMANDS: Dict[str, CommandHandler] = {}
+
+# 帮助信息，按注册顺序排列
+HELP_LINES: List[str] = []
+
+# 队伍列表的页码参数，例如"第2页"
+PAGE_PATTERN = re.compile(r'^第(\d+)页$')
+
+# 简化的开始时间格式 (HH:MM)
+SHORT_TIME_PATTERN = re.compile(r'^([0-1]?[0-9]|2[0-3]):([0-5][0-9])$')
+
+INVALID_TEAM_ID = "请输入正确的队伍序号"
+
+# 按用户和按群的命令限流，防止个别用户或群刷屏占满数据库和发送队列
+user_limiter = SlidingWindowLimiter(RATE_LIMIT_USER, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_KEYS)
+group_limiter = SlidingWindowLimiter(RATE_LIMIT_GROUP, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_KEYS)
+
+# 渲染好的队伍列表回复，群里的队伍有变化前，同样的查询直接返回
+list_reply_cache = ReplyCache(LIST_REPLY_CACHE_SIZE)
+
+
+# 注册命令，usage会出现在帮助信息中
+def command(name: str, *usages: str):
+    def decorator(func: CommandHandler) -> CommandHandler:
+        COMMANDS[name] = func
+        HELP_LINES.extend(usages)
+        return func
+    return decorator
+
+
+# 解析队伍序号，格式不对时返回None
+def parse_team_id(args: str) -> Optional[int]:
+    return int(args) if args.isdecimal() else None
+
+
+# 解析"车队 查询"后面的过滤参数，返回(服务器, 页码)，参数不合法时返回None
+def parse_list_filters(args: str):
+    server = None
+    page = 1
+    for token in args.split():
+        page_match = PAGE_PATTERN.match(token)
+        if token in SERVERS and server is None:
+            server = token
+        elif page_match and int(page_match.group(1)) >= 1:
+            page = int(page_match.group(1))
+        else:
+            return None
+    return server, page
+
+
+# 解析开始时间，支持"HH:MM"（当天）和"YYYY-MM-DD HH:MM:SS"，按服务器所在时区解释
+# 返回时间戳，格式不对时抛出ValueError
+def parse_start_time(time_input: str, server: str) -> int:
+    short_match = SHORT_TIME_PATTERN.match(time_input)
+    if short_match:
+        # 如果是简化格式，使用服务器时区的当天日期
+        return today_at(int(short_match.group(1)), int(short_match.group(2)), server)
+
+    # 尝试完整格式解析
+    return parse_local(time_input, server)
+
+
+def _nickname(message: QQMessage) -> str:
+    return message.sender.get("nickname", f"用户{message.user_id}")
+
+
+# 查询本群的队伍列表，或查询指定队伍的成员
+@command(
+    "查询",
+    "- 车队 查询 [服务器] [第N页]：列出本群发布的队伍，可按服务器过滤",
+    "- 车队 查询 [序号]：列出这个队伍的当前加入人",
+)
+async def query_command(message: QQMessage, args: str) -> str:
+    if args.isdecimal():
+        return await _team_detail(message, int(args))
+
+    filters = parse_list_filters(args)
+    if filters is None:
+        return "请输入正确的格式：车队 查询 [服务器] [第N页]，例如：车队 查询 日服 第2页"
+
+    server, page = filters
+    if not LIST_REPLY_CACHE_SIZE:
+        return await _team_list(message.group_id, server, page)
+
+    # 先取版本号再读队伍，读取期间有写入时缓存的是更新后的内容，只会让下次查询多一次未命中
+    version = await get_group_version(message.group_id)
+    if version is None:
+        return await _team_list(message.group_id, server, page)
+
+    key = (message.group_id, server, page)
+    response = list_reply_cache.get(key, version)
+    if response is not None:
+        REPLY_CACHE_TOTAL.inc("hit")
+        return response
+
+    REPLY_CACHE_TOTAL.inc("miss")
+    response = await _team_list(message.group_id, server, page)
+    list_reply_cache.put(key, version, response)
+    return response
+
+
+# 渲染某个群的队伍列表
+async def _team_list(group_id: str, server: Optional[str], page: int) -> str:
+    teams, total = await get_group_teams(
+        group_id, server, (page - 1) * TEAM_PAGE_SIZE, TEAM_PAGE_SIZE)
+    page_count = (total + TEAM_PAGE_SIZE - 1) // TEAM_PAGE_SIZE
+    if not total:
+        return "当前没有队伍"
+    if not teams:
+        return f"只有 {page_count} 页队伍"
+
+    response = "当前队伍列表：\n" if page_count == 1 else f"当前队伍列表（第{page}/{page_count}页）：\n"
+    for team in teams:
+        response += f"[{team.id}] {team.creator_name} [{len(team.members)}/{TEAM_CAPACITY}] {format_local(team.start_time, team.server)} [{team.server}]\n"
+    if page < page_count:
+        next_command = " ".join(filter(None, ["车队 查询", server, f"第{page + 1}页"]))
+        response += f"发送'{next_command}'查看下一页"
+    return response
+
+
+async def _team_detail(message: QQMessage, team_id: int) -> str:
+    team = await get_team(team_id)
+    # 只能查看本群的队伍
+    if not team or team.group_id != message.group_id:
+        return f"队伍 {team_id} 不存在"
+
+    response = f"队伍 {team_id} 成员列表：\n"
+    for i, member in enumerate(team.members, 1):
+        response += f"{i}. {member.nickname}\n"
+    response += f"开始时间: {format_local(team.start_time, team.server)}（{team.server}时间）"
+    return response
+
+
+# 加入队伍
+@command("加入", "- 车队 加入 [序号]：加入指定的队伍")
+async def join_command(message: QQMessage, args: str) -> str:
+    team_id = parse_team_id(args)
+    if team_id is None:
+        return INVALID_TEAM_ID
+
+    member = TeamMember(qq_id=message.user_id, nickname=_nickname(message))
+    success, msg = await join_team(team_id, member)
+    return msg
+
+
+# 删除队伍
+@command("删除", "- 车队 删除 [序号]：删除该队伍")
+async def delete_command(message: QQMessage, args: str) -> str:
+    team_id = parse_team_id(args)
+    if team_id is None:
+        return INVALID_TEAM_ID
+
+    # 删除前记下开始时间，用于取消该时间的提醒
+    team = await get_team(team_id)
+    success, msg = await delete_team(team_id, message.user_id)
+    if success:
+        if team is not None:
+            await cancel_team_notification(team.start_time)
+        logger.info("删除队伍", extra={"team_id": team_id, "group_id": message.group_id, "user_id": message.user_id})
+    return msg
+
+
+# 创建队伍
+@command("创建", "- 车队 创建 [服务器] [开始时间]：创建一个新队伍，时间格式为'小时:分钟'，按服务器所在时区")
+async def create_command(message: QQMessage, args: str) -> str:
+    # 开始时间可能是带空格的完整格式，只拆出第一个参数
+    params = args.split(None, 1)
+    if len(params) < 2:
+        return "请输入正确的格式：车队 创建 [服务器] [开始时间]，例如：车队 创建 日服 20:30"
+
+    server, time_input = params[0], params[1].strip()
+
+    # 验证服务器参数
+    if server not in SERVERS:
+        return "服务器只能是'日服'、'台服'、'国际服'或'国服'"
+
+    try:
+        start_time = parse_start_time(time_input, server)
+    except ValueError:
+        return "请输入正确的时间格式，例如：20:30 或 2023-11-01 20:00:00"
+
+    # 创建队伍
+    team = Team(
+        creator_id=message.user_id,
+        creator_name=_nickname(message),
+        start_time=start_time,
+        members=[],  # 初始化空成员列表
+        group_id=message.group_id,  # 存储群ID以便后续通知
+        server=server  # 设置服务器信息
+    )
+    team_id = await create_team(team)
+    if team_id is None:
+        return f"你已经有 {MAX_OPEN_TEAMS_PER_CREATOR} 个尚未开始的队伍，请等队伍开始或删除后再创建"
+    logger.info("创建队伍", extra={"team_id": team_id, "group_id": message.group_id, "user_id": message.user_id})
+    # 在开始时间安排一次性提醒
+    schedule_team_notification(start_time)
+    return f"队伍创建成功，序号为 {team_id}"
+
+
+# 退出队伍
+@command("退出", "- 车队 退出 [序号]：退出指定的队伍")
+async def leave_command(message: QQMessage, args: str) -> str:
+    team_id = parse_team_id(args)
+    if team_id is None:
+        return INVALID_TEAM_ID
+
+    success, msg = await leave_team(team_id, message.user_id)
+    return msg
+
+
+# 消息对应的命令名，用作指标的标签；未注册的命令统一记为"未知"，避免标签无限增长
+def command_label(message: QQMessage) -> str:
+    parts = message.message[2:].split(None, 1)
+    if not parts:
+        return "帮助"
+    return parts[0] if parts[0] in COMMANDS else "未知"
+
+
+# 帮助信息只在导入时拼接一次
+HELP_TEXT = "车队命令帮助：\n" + "".join(line + "\n" for line in HELP_LINES)
+
+
+# 检查命令是否超过限流，返回被限流的对象（"user"或"group"），未超过时返回None
+# 先检查用户，被拒绝的用户不会再占用所在群的额度
+def check_rate_limit(message: QQMessage) -> Optional[str]:
+    if not user_limiter.allow(message.user_id):
+        return "user"
+    if not group_limiter.allow(message.group_id):
+        return "group"
+    return None
+
+
+# 超过限流的命令直接忽略，不查询数据库也不回复：返回忽略的结果，未超过限流时返回None
+# 由routes.py在处理事件前调用，早于事件去重的持久化认领，被限流的事件不会写入数据库
+def rate_limited(message: QQMessage) -> Optional[dict]:
+    scope = check_rate_limit(message)
+    if scope is None:
+        return None
+
+    RATE_LIMITED.inc(scope)
+    logger.debug("命令过于频繁，已忽略", extra={"scope": scope, "group_id": message.group_id,
+                                          "user_id": message.user_id})
+    return {
+        "status": "ignored",
+        "reason": "rate limited",
+        "group_id": message.group_id
+    }
+
+
+# quick_reply为True时回复由调用方通过/event的响应返回，这里不再发送
 async def handle_team(
     message: QQMessage,
+    quick_reply: bool = False,
 ):
-    # 去掉前缀
-    command = message.message[2:].strip()
-
-    # 处理命令
-    response = ""
-
-    # 帮助命令
-    if not command:
-        response = "车队命令帮助：\n"
-        response += "- 车队 查询：列出所有发布的队伍\n"
-        response += "- 车队 加入 [序号]：加入指定的队伍\n"
-        response += "- 车队 查询 [序号]：列出这个队伍的当前加入人\n"
-        response += "- 车队 删除 [序号]：删除该队伍\n"
-        response += "- 车队 创建 [服务器] [开始时间]：创建一个新队伍，时间格式为'小时:分钟'\n"
-        response += "- 车队 退出 [序号]：退出指定的队伍\n"
-
-    # 查询所有队伍
-    elif command == "查询":
-        teams = await get_all_teams()
-        if not teams:
-            response = "当前没有队伍"
-        else:
-            response = "当前队伍列表：\n"
-            for team in teams:
-                response += f"[{team.id}] {team.creator_name} [{len(team.members)}/5] {team.start_time} [{team.server}]\n"
-
-    # 查询指定队伍
-    elif command.startswith("查询 "):
-        try:
-            team_id = int(command[3:].strip())
-            team = await get_team(team_id)
-            if not team:
-                response = f"队伍 {team_id} 不存在"
-            else:
-                response = f"队伍 {team_id} 成员列表：\n"
-                for i, member in enumerate(team.members, 1):
-                    response += f"{i}. {member.nickname}\n"
-                response += f"开始时间: {team.start_time}"
-        except ValueError:
-            response = "请输入正确的队伍序号"
-
-    # 加入队伍
-    elif command.startswith("加入 "):
-        try:
-            team_id = int(command[3:].strip())
-            member = TeamMember(qq_id=message.user_id, nickname=message.sender.get(
-                "nickname", f"用户{message.user_id}"))
-            success, msg = await join_team(team_id, member)
-            response = msg
-        except ValueError:
-            response = "请输入正确的队伍序号"
-
-    # 删除队伍
-    elif command.startswith("删除 "):
-        try:
-            team_id = int(command[3:].strip())
-            success, msg = await delete_team(team_id, message.user_id)
-            response = msg
-        except ValueError:
-            response = "请输入正确的队伍序号"
+    # 去掉前缀，拆出命令名和参数
+    parts = message.message[2:].split(None, 1)
 
-    # 创建队伍
-    elif command.startswith("创建 "):
-        try:
-            params = command[3:].strip().split()
-            if len(params) < 2:
-                response = "请输入正确的格式：车队 创建 [服务器] [开始时间]，例如：车队 创建 日服 20:30"
-                return {"status": "error", "message": response, "group_id": message.group_id}
-
-            server = params[0]
-            time_input = params[1]
-
-            # 验证服务器参数
-            if server not in ["日服", "台服", "国际服", "国服"]:
-                response = "服务器只能是'日服'、'台服'、'国际服'或'国服'"
-                return {"status": "error", "message": response, "group_id": message.group_id}
-            # 检查是否为简化的时间格式 (HH:MM)
-            import datetime
-            import re
-
-            # 使用正则表达式匹配HH:MM格式
-            if re.match(r'^([0-1]?[0-9]|2[0-3]):([0-5][0-9])$', time_input):
-                # 如果是简化格式，添加当天日期
-                today = datetime.datetime.now().strftime("%Y-%m-%d")
-                start_time = f"{today} {time_input}:00"
-            else:
-                # 尝试完整格式解析
-                start_time = time_input
-                datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
-
-            # 创建队伍
-            team = Team(
-                creator_id=message.user_id,
-                creator_name=message.sender.get(
-                    "nickname", f"用户{message.user_id}"),
-                start_time=start_time,
-                members=[],  # 初始化空成员列表
-                group_id=message.group_id,  # 存储群ID以便后续通知
-                server=server  # 设置服务器信息
-            )
-            team_id = await create_team(team)
-            response = f"队伍创建成功，序号为 {team_id}"
-        except ValueError:
-            response = "请输入正确的时间格式，例如：20:30 或 2023-11-01 20:00:00"
-
-    # 退出队伍
-    elif command.startswith("退出 "):
-        try:
-            team_id = int(command[3:].strip())
-            success, msg = await leave_team(team_id, message.user_id)
-            response = msg
-        except ValueError:
-            response = "请输入正确的队伍序号"
-
-    # 未知命令
+    if not parts:
+        # 帮助命令
+        response = HELP_TEXT
     else:
-        response = "未知命令，请输入'车队'查看帮助"
+        handler = COMMANDS.get(parts[0])
+        if handler is None:
+            # 未知命令
+            response = "未知命令，请输入'车队'查看帮助"
+        else:
+            response = await handler(message, parts[1].strip() if len(parts) > 1 else "")
 
-    # 发送响应消息到群
-    if response:
-        await send_group_message(message.group_id, response)
+    # 将响应消息加入发送队列，不等待发送完成
+    if response and not quick_reply:
+        enqueue_group_message(message.group_id, response)
 
     # 构建返回消息
     return {
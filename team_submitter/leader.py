@@ -0,0 +1,88 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from team_submitter.database import release_lease, try_acquire_lease
+from utils.log import get_logger
+
+logger = get_logger("leader")
+
+
+# 基于数据库租约的选主：持有租约的进程是主进程，负责运行定时任务
+# 主进程退出或卡住时租约过期，其他进程在下一次尝试时接管
+class LeaderElection:
+    def __init__(
+        self,
+        ttl: float,
+        on_elected: Callable[[], Awaitable[None]],
+        on_demoted: Callable[[], Awaitable[None]],
+    ):
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._last_renewed = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    # 立即尝试一次，然后在后台定期续期或抢占
+    async def start(self):
+        await self._tick()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        if self.is_leader:
+            await self._demote()
+            try:
+                await release_lease(self.owner)
+            except Exception:
+                logger.exception("释放调度器租约失败", extra={"owner": self.owner})
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self._tick()
+            except Exception:
+                # 任何意外都不能结束续期循环，否则租约会在本进程仍自认为是主进程时过期
+                logger.exception("调度器选主出错", extra={"owner": self.owner})
+
+    async def _tick(self):
+        try:
+            acquired = await try_acquire_lease(self.owner, self.ttl)
+        except Exception:
+            logger.exception("续期调度器租约失败", extra={"owner": self.owner})
+            # 租约可能已经过期，为避免两个进程同时运行定时任务，主动让出
+            if self.is_leader and time.monotonic() - self._last_renewed >= self.ttl * 2 / 3:
+                await self._demote()
+            return
+
+        if acquired:
+            self._last_renewed = time.monotonic()
+            if not self.is_leader:
+                self.is_leader = True
+                logger.info("成为调度主进程", extra={"owner": self.owner})
+                try:
+                    await self._on_elected()
+                except Exception:
+                    # 例如恢复开始提醒时数据库出错：撤掉已经添加的任务，下一次续期时再重新初始化
+                    logger.exception("成为主进程后初始化定时任务失败", extra={"owner": self.owner})
+                    await self._demote()
+        elif self.is_leader:
+            await self._demote()
+
+    async def _demote(self):
+        self.is_leader = False
+        logger.info("不再是调度主进程", extra={"owner": self.owner})
+        try:
+            await self._on_demoted()
+        except Exception:
+            logger.exception("移除定时任务失败", extra={"owner": self.owner})
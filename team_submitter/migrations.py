@@ -0,0 +1,238 @@
+import datetime
+
+import aiosqlite
+
+from utils.log import get_logger
+
+logger = get_logger("migrations")
+
+# 数据库结构迁移，版本号记录在SQLite的user_version中
+# 新增迁移时只需在MIGRATIONS末尾追加函数，已发布的迁移不要再修改
+
+
+# 版本1：初始表结构
+async def _create_tables(db: aiosqlite.Connection):
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS teams (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        creator_id TEXT NOT NULL,
+        creator_name TEXT NOT NULL,
+        start_time TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        group_id TEXT,
+        server TEXT CHECK(server IN ('日服', '台服', '国际服', '国服')) NOT NULL
+    )
+    """)
+
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS team_members (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        team_id INTEGER NOT NULL,
+        qq_id TEXT NOT NULL,
+        nickname TEXT NOT NULL,
+        FOREIGN KEY (team_id) REFERENCES teams (id) ON DELETE CASCADE
+    )
+    """)
+
+
+# 版本2：清理孤儿成员和重复成员，添加索引和唯一约束
+async def _add_indexes(db: aiosqlite.Connection):
+    # 之前没有开启外键，删除队伍后成员记录不会被级联删除
+    await db.execute("DELETE FROM team_members WHERE team_id NOT IN (SELECT id FROM teams)")
+
+    # 同一个人在同一队伍中只保留最早的一条记录
+    await db.execute("""
+    DELETE FROM team_members
+    WHERE id NOT IN (SELECT MIN(id) FROM team_members GROUP BY team_id, qq_id)
+    """)
+
+    # 成员唯一约束，同时用于按队伍和QQ号查找成员以及统计人数
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_team_members_team_qq ON team_members (team_id, qq_id)"
+    )
+
+    # 覆盖索引，按队伍列出成员时无需回表
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_team_members_team_cover ON team_members (team_id, id, qq_id, nickname)"
+    )
+
+    # 按开始时间查询即将开始的队伍和删除过期队伍
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_teams_start_time ON teams (start_time)")
+
+
+# 版本3：记录开始提醒的发送时间，保证每个队伍只提醒一次
+async def _add_notified_at(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE teams ADD COLUMN notified_at TEXT")
+
+    # 已经开始的队伍视为已提醒，避免升级后重复@成员
+    await db.execute(
+        "UPDATE teams SET notified_at = start_time WHERE start_time <= ?",
+        (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),)
+    )
+
+    # 只索引尚未提醒的队伍，启动时重建定时任务用
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_teams_pending_start ON teams (start_time) WHERE notified_at IS NULL"
+    )
+
+
+# 版本4：按群列出队伍
+async def _add_group_index(db: aiosqlite.Connection):
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_teams_group_id ON teams (group_id, id)")
+
+
+# 版本5：调度器租约，多进程部署时只有持有租约的进程运行定时任务
+async def _add_scheduler_lease(db: aiosqlite.Connection):
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS scheduler_lease (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """)
+
+
+# 版本6：时间改为整数的Unix时间戳（秒），按开始时间的范围查询走整数索引
+# SQLite不能修改列类型，只能重建teams表；旧数据是服务器本地时间的字符串，用'utc'修饰符换算
+async def _store_epoch_times(db: aiosqlite.Connection):
+    await db.execute("""
+    CREATE TABLE teams_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        creator_id TEXT NOT NULL,
+        creator_name TEXT NOT NULL,
+        start_time INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        group_id TEXT,
+        server TEXT CHECK(server IN ('日服', '台服', '国际服', '国服')) NOT NULL,
+        notified_at INTEGER
+    )
+    """)
+
+    # 无法解析的开始时间没办法提醒也无法判断是否过期，直接丢弃
+    await db.execute("""
+    INSERT INTO teams_new (id, creator_id, creator_name, start_time, created_at, group_id, server, notified_at)
+    SELECT id, creator_id, creator_name,
+           CAST(strftime('%s', start_time, 'utc') AS INTEGER),
+           COALESCE(CAST(strftime('%s', created_at, 'utc') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)),
+           group_id, server,
+           CAST(strftime('%s', notified_at, 'utc') AS INTEGER)
+    FROM teams
+    WHERE strftime('%s', start_time, 'utc') IS NOT NULL
+    """)
+    await db.execute("DELETE FROM team_members WHERE team_id NOT IN (SELECT id FROM teams_new)")
+
+    # 新表的自增计数只到复制过来的最大ID，最新的队伍被删除过时会重新分配它的ID，沿用旧表的计数
+    await db.execute("DELETE FROM sqlite_sequence WHERE name = 'teams_new'")
+    await db.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'teams_new', seq FROM sqlite_sequence WHERE name = 'teams'")
+
+    # 重建表时外键已关闭，删除旧表不会级联删除成员
+    await db.execute("DROP TABLE teams")
+    await db.execute("ALTER TABLE teams_new RENAME TO teams")
+
+    # 旧表上的索引随旧表一起删除，需要重新创建
+    await db.execute("CREATE INDEX idx_teams_start_time ON teams (start_time)")
+    await db.execute("CREATE INDEX idx_teams_pending_start ON teams (start_time) WHERE notified_at IS NULL")
+    await db.execute("CREATE INDEX idx_teams_group_id ON teams (group_id, id)")
+
+
+# 版本7：记录处理过的消息ID，多进程部署或重启后也能识别go-cqhttp重复投递的事件
+async def _add_processed_events(db: aiosqlite.Connection):
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS processed_events (
+        event_key TEXT PRIMARY KEY,
+        seen_at INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_processed_events_seen_at ON processed_events (seen_at)")
+
+
+# 版本8：创建队伍时按创建者统计尚未开始的队伍数
+async def _add_creator_index(db: aiosqlite.Connection):
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_teams_creator_start ON teams (creator_id, start_time)")
+
+
+# 版本9：队伍和成员的变更计数，由触发器在每次修改时加一
+# 多进程部署时各进程据此判断缓存是否过期，租约续期、事件去重等其他表的写入不会改变它
+async def _add_team_changes(db: aiosqlite.Connection):
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS team_changes (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    await db.execute("INSERT OR IGNORE INTO team_changes (id, version) VALUES (1, 0)")
+    for table in ("teams", "team_members"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_changes AFTER {event} ON {table}
+            BEGIN
+                UPDATE team_changes SET version = version + 1 WHERE id = 1;
+            END
+            """)
+
+
+MIGRATIONS = [
+    _create_tables,
+    _add_indexes,
+    _add_notified_at,
+    _add_group_index,
+    _add_scheduler_lease,
+    _store_epoch_times,
+    _add_processed_events,
+    _add_creator_index,
+    _add_team_changes,
+]
+
+# 需要重建表的迁移，执行期间关闭外键约束（外键开关在事务中无法修改，必须在BEGIN之前设置）
+TABLE_REBUILDS = {_store_epoch_times}
+
+
+async def _execute_pragma(db: aiosqlite.Connection, pragma: str):
+    async with db.execute(pragma) as cursor:
+        await cursor.fetchall()
+
+
+async def _user_version(db: aiosqlite.Connection) -> int:
+    async with db.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+# 执行所有未执行的迁移，每个迁移在单独的事务中完成
+# 多个进程同时启动时都会执行这里：拿到写锁后重新读取版本号，已被其他进程完成的迁移直接跳过
+async def run_migrations(db: aiosqlite.Connection):
+    while True:
+        version = await _user_version(db)
+        if version >= len(MIGRATIONS):
+            return
+
+        target_version = version + 1
+        migration = MIGRATIONS[version]
+        rebuild = migration in TABLE_REBUILDS
+        if rebuild:
+            await _execute_pragma(db, "PRAGMA foreign_keys = OFF")
+
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            if await _user_version(db) != version:
+                # 等待写锁期间其他进程已经完成了这个迁移，重新读取版本号
+                await db.rollback()
+                continue
+
+            await migration(db)
+            if rebuild:
+                # 重建后外键关系必须仍然成立
+                async with db.execute("PRAGMA foreign_key_check") as cursor:
+                    if await cursor.fetchone() is not None:
+                        raise RuntimeError(f"迁移到版本 {target_version} 后外键检查失败")
+            # user_version也是事务的一部分，迁移失败时会一起回滚
+            await db.execute(f"PRAGMA user_version = {target_version}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            if rebuild:
+                await _execute_pragma(db, "PRAGMA foreign_keys = ON")
+
+        logger.info("数据库已迁移到版本 %d", target_version)
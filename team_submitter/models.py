@@ -1,23 +1,34 @@
+from dataclasses import dataclass, field
 from typing import List, Optional
 from pydantic import BaseModel
 
+# 支持的服务器
+SERVERS = ("日服", "台服", "国际服", "国服")
+
 # 定义数据模型
-class TeamMember(BaseModel):
+# 队伍和成员只在数据库、缓存和命令处理之间传递，数据来自我们自己的表结构，不需要再做校验
+# 使用带__slots__的dataclass，构造开销和内存占用都远小于pydantic模型
+@dataclass(slots=True)
+class TeamMember:
     qq_id: str
     nickname: str
 
-class Team(BaseModel):
+@dataclass(slots=True, kw_only=True)
+class Team:
     id: Optional[int] = None
     creator_id: str
     creator_name: str
-    start_time: str
-    members: List[TeamMember] = []
-    created_at: Optional[str] = None
+    start_time: int  # Unix时间戳（秒）
+    members: List[TeamMember] = field(default_factory=list)
+    created_at: Optional[int] = None
     group_id: Optional[str] = None  # 添加群ID字段，用于后续通知
     server: str = "日服"  # 添加服务器字段，默认为日服
+    notified_at: Optional[int] = None  # 开始提醒的发送时间，未提醒时为空
 
+# go-cqhttp上报的消息来自外部，仍然使用pydantic模型
 class QQMessage(BaseModel):
     group_id: str
     user_id: str
     message: str
-    sender: dict
\ No newline at end of file
+    sender: dict
+    message_id: Optional[str] = None  # OneBot的消息ID，用于识别重复投递
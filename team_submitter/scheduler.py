@@ -1,9 +1,33 @@
+import asyncio
 import datetime
+import time
+from typing import Dict, List
+
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from team_submitter.database import delete_expired_teams, get_upcoming_teams, get_team_members, delete_team_by_id
-from utils.sender import send_group_message
+from team_submitter.database import (delete_expired_teams, get_pending_teams, get_upcoming_teams,
+                                     has_pending_team_at, mark_teams_notified, purge_processed_events)
+from team_submitter.leader import LeaderElection
+from team_submitter.models import Team
+from utils.config import (
+    EVENT_DEDUP_PERSIST,
+    EVENT_DEDUP_TTL,
+    EXPIRY_BATCH_SIZE,
+    EXPIRY_SWEEP_SECONDS,
+    NOTIFY_CONCURRENCY,
+    NOTIFY_GRACE_SECONDS,
+    NOTIFY_SYNC_SECONDS,
+    SCHEDULER_LEASE_TTL,
+    TEAM_EXPIRE_AFTER_SECONDS,
+    WORKERS,
+)
+from utils.log import get_logger
+from utils.metrics import JOB_SECONDS, NOTIFY_LAG_SECONDS, timed
+from utils.outbox import enqueue_group_message
+
+logger = get_logger("scheduler")
 
 # 创建调度器
 scheduler = AsyncIOScheduler()
@@ -11,62 +35,221 @@ scheduler = AsyncIOScheduler()
 # 检查队伍开始时间并通知
 
 
+@timed(JOB_SECONDS)
 async def check_team_start_times():
-    current_time = datetime.datetime.now()
-    # 向前后1分钟的时间范围
-    start_time = (current_time - datetime.timedelta(minutes=1)
-                  ).strftime("%Y-%m-%d %H:%M:%S")
-    end_time = (current_time + datetime.timedelta(minutes=1)
-                ).strftime("%Y-%m-%d %H:%M:%S")
-
-    # 获取即将开始的队伍
+    current_time = time.time()
+    # 已到开始时间、且延迟不超过允许范围的队伍
+    end_time = int(current_time)
+    start_time = end_time - NOTIFY_GRACE_SECONDS
+
+    # 获取已开始但尚未提醒的队伍
     teams = await get_upcoming_teams(start_time, end_time)
+    if not teams:
+        return
 
+    # 先标记再发送，同一时间触发的多个任务只会有一个拿到队伍
+    claimed = set(await mark_teams_notified([team.id for team in teams]))
+
+    # 按群合并，同一个群同时开始的多个队伍只发一条消息；成员已经随队伍一起查出
+    by_group: Dict[str, List[Team]] = {}
     for team in teams:
-        # 获取队伍成员
-        members = await get_team_members(team['id'])
-
-        # 构建@所有成员的消息
-        at_message = f"队伍 {team['id']} 即将开始！\n"
-        for member in members:
-            at_message += f"[CQ:at,qq={member['qq_id']}] "
-
-        # 调用send_group_message函数发送群消息
-        print(
-            f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 准备发送通知: {at_message}")
-        # 假设team中有group_id字段，如果没有，需要从其他地方获取
-        if 'group_id' in team:
-            success = await send_group_message(team['group_id'], at_message)
-            if success:
-                print(
-                    f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 成功发送通知到群 {team['group_id']}")
-            else:
-                print(
-                    f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 发送通知到群 {team['group_id']} 失败")
-        else:
-            print(
-                f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 无法发送通知: 缺少群ID信息")
+        if team.id not in claimed:
+            continue
+        if not team.group_id:
+            logger.warning("无法发送开始提醒: 缺少群ID信息", extra={"team_id": team.id})
+            continue
+        by_group.setdefault(team.group_id, []).append(team)
+        NOTIFY_LAG_SECONDS.observe(max(0.0, current_time - team.start_time))
 
+    # 各群的提醒并发发送，同时进行的发送数量有上限
+    semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+    await asyncio.gather(*(
+        _notify_group(group_id, group_teams, semaphore) for group_id, group_teams in by_group.items()
+    ))
 
 
-# 初始化调度任务
+# 构建一个群的开始提醒，@每个队伍的成员
+
+
+def build_start_message(teams: List[Team]) -> str:
+    if len(teams) == 1:
+        team = teams[0]
+        return f"队伍 {team.id} 即将开始！\n" + "".join(
+            f"[CQ:at,qq={member.qq_id}] " for member in team.members)
+
+    message = f"队伍 {'、'.join(str(team.id) for team in teams)} 即将开始！"
+    for team in teams:
+        message += f"\n队伍 {team.id}：" + "".join(
+            f"[CQ:at,qq={member.qq_id}] " for member in team.members)
+    return message
+
+
+async def _notify_group(group_id: str, teams: List[Team], semaphore: asyncio.Semaphore):
+    at_message = build_start_message(teams)
+    fields = {
+        "group_id": group_id,
+        "team_ids": [team.id for team in teams],
+        "members": sum(len(team.members) for team in teams),
+    }
+    logger.debug("准备发送开始提醒: %s", at_message, extra=fields)
+
+    # 通过发送队列发送群消息
+    async with semaphore:
+        success = await enqueue_group_message(group_id, at_message)
+    if success:
+        logger.info("已发送开始提醒", extra=fields)
+    else:
+        logger.warning("开始提醒发送失败", extra=fields)
+
+
+
+# 开始提醒任务的ID，同一时间开始的队伍共用一个任务
+
+
+def _notify_job_id(start_time: int) -> str:
+    return f"team_start_{start_time}"
 
 
-def init_scheduler():
-    # 每天凌晨4点删除过期队伍
+# 在队伍开始时间安排一次性提醒
+
+
+def schedule_team_notification(start_time: int):
+    # 非调度主进程不安排提醒，由主进程从数据库同步
+    if not election.is_leader:
+        return
+
+    # 同一时间开始的队伍已经安排过提醒，到点时一次查出所有队伍
+    job_id = _notify_job_id(start_time)
+    if scheduler.get_job(job_id) is not None:
+        return
+
+    run_date = datetime.datetime.fromtimestamp(start_time, datetime.timezone.utc)
     scheduler.add_job(
-        delete_expired_teams,
-        CronTrigger(hour=4, minute=0),
-        id="delete_expired_teams"
+        check_team_start_times,
+        'date',
+        run_date=run_date,
+        id=job_id,
+        replace_existing=True,
+        misfire_grace_time=NOTIFY_GRACE_SECONDS
     )
 
-    # 每分钟检查一次队伍开始时间
+
+# 删除队伍后取消其开始时间的提醒，同一时间还有其他待提醒的队伍时保留
+
+
+async def cancel_team_notification(start_time: int):
+    job_id = _notify_job_id(start_time)
+    if scheduler.get_job(job_id) is None or await has_pending_team_at(start_time):
+        return
+    try:
+        scheduler.remove_job(job_id)
+    except JobLookupError:
+        pass
+
+
+# 根据数据库中尚未提醒的队伍重建定时提醒，并移除已被删除的队伍的提醒
+# 成为调度主进程时调用；多进程部署时定期调用，同步其他进程创建和删除的队伍
+
+
+@timed(JOB_SECONDS)
+async def restore_team_notifications(verbose: bool = True):
+    since = int(time.time()) - NOTIFY_GRACE_SECONDS
+    pending = await get_pending_teams(since)
+
+    scheduled = {job.id for job in scheduler.get_jobs() if job.id.startswith("team_start_")}
+    wanted = set()
+    for _, start_time in pending:
+        job_id = _notify_job_id(start_time)
+        if job_id in wanted:
+            continue
+        wanted.add(job_id)
+        if job_id not in scheduled:
+            schedule_team_notification(start_time)
+    for job_id in scheduled - wanted:
+        try:
+            scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+
+    if verbose:
+        logger.info("已恢复 %d 个队伍的开始提醒（%d 个提醒任务）", len(pending), len(wanted))
+
+
+# 分批删除开始时间超过TEAM_EXPIRE_AFTER_SECONDS的队伍
+
+
+@timed(JOB_SECONDS)
+async def sweep_expired_teams():
+    expire_after = max(TEAM_EXPIRE_AFTER_SECONDS, NOTIFY_GRACE_SECONDS)
+    now = int(time.time())
+    await delete_expired_teams(now - expire_after, EXPIRY_BATCH_SIZE)
+
+    # 顺便清理过期的事件处理记录
+    if EVENT_DEDUP_PERSIST:
+        await purge_processed_events(now - EVENT_DEDUP_TTL)
+
+
+# 成为调度主进程：添加定时任务并恢复尚未发送的提醒
+
+
+async def _on_elected():
+    # 持续清理刚过期的队伍，每次只删除少量队伍
     scheduler.add_job(
-        check_team_start_times,
+        sweep_expired_teams,
         'interval',
-        minutes=1,
-        id="check_team_start_times"
+        seconds=EXPIRY_SWEEP_SECONDS,
+        id="sweep_expired_teams",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
     )
 
-    # 启动调度器
+    # 每天凌晨4点再清理一次，作为持续清理的兜底
+    scheduler.add_job(
+        sweep_expired_teams,
+        CronTrigger(hour=4, minute=0),
+        id="delete_expired_teams",
+        replace_existing=True
+    )
+
+    # 多进程部署时，定期同步其他进程创建和删除的队伍
+    if WORKERS > 1:
+        scheduler.add_job(
+            restore_team_notifications,
+            'interval',
+            seconds=NOTIFY_SYNC_SECONDS,
+            kwargs={"verbose": False},
+            id="sync_team_notifications",
+            replace_existing=True
+        )
+
+    await restore_team_notifications()
+
+
+# 失去调度主进程身份：移除所有定时任务，由新的主进程接管
+
+
+async def _on_demoted():
+    scheduler.remove_all_jobs()
+
+
+# 调度器选主，只有主进程运行定时任务
+election = LeaderElection(SCHEDULER_LEASE_TTL, _on_elected, _on_demoted)
+
+
+# 初始化调度任务
+
+
+async def init_scheduler():
+    # 启动调度器，定时任务在成为主进程后才添加
     scheduler.start()
+    await election.start()
+
+
+# 停止调度任务并释放租约
+
+
+async def shutdown_scheduler():
+    await election.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
@@ -0,0 +1,42 @@
+import datetime
+import time
+from typing import Dict, Optional
+
+from team_submitter.models import SERVERS
+from utils.config import SERVER_UTC_OFFSETS
+
+# 数据库和缓存中的时间都是整数的Unix时间戳（秒），只在解析用户输入和显示时按服务器时区换算
+
+# 服务器 -> 时区，使用固定偏移，这几个地区都没有夏令时
+SERVER_TIMEZONES: Dict[str, datetime.timezone] = {
+    server: datetime.timezone(datetime.timedelta(hours=SERVER_UTC_OFFSETS.get(server, 0.0)))
+    for server in SERVERS
+}
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def server_timezone(server: str) -> datetime.timezone:
+    return SERVER_TIMEZONES.get(server, datetime.timezone.utc)
+
+
+# 当前时间的时间戳
+def now_ts() -> int:
+    return int(time.time())
+
+
+# 把服务器时区的"YYYY-MM-DD HH:MM:SS"转换为时间戳，格式不对时抛出ValueError
+def parse_local(text: str, server: str) -> int:
+    local = datetime.datetime.strptime(text, TIME_FORMAT).replace(tzinfo=server_timezone(server))
+    return int(local.timestamp())
+
+
+# 服务器时区当天的指定时刻
+def today_at(hour: int, minute: int, server: str, now: Optional[float] = None) -> int:
+    today = datetime.datetime.fromtimestamp(time.time() if now is None else now, server_timezone(server))
+    return int(today.replace(hour=hour, minute=minute, second=0, microsecond=0).timestamp())
+
+
+# 把时间戳显示为服务器时区的"YYYY-MM-DD HH:MM:SS"
+def format_local(ts: int, server: str) -> str:
+    return datetime.datetime.fromtimestamp(ts, server_timezone(server)).strftime(TIME_FORMAT)
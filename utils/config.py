@@ -0,0 +1,120 @@
+import os
+
+from dotenv import load_dotenv
+
+# 从.env文件或环境变量加载配置
+load_dotenv()
+
+# 数据库路径
+DATABASE_PATH = os.getenv("DATABASE_PATH", "teams.db")
+
+# 只读连接池大小（写连接固定为1个）
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))
+
+# go-cqhttp的HTTP API地址
+CQHTTP_API_URL = os.getenv("CQHTTP_API_URL", "http://127.0.0.1:3000")
+
+# 调用go-cqhttp API的超时时间（秒）
+CQHTTP_TIMEOUT = float(os.getenv("CQHTTP_TIMEOUT", "10"))
+
+# 到go-cqhttp的最大连接数（同时也是保持的长连接数）
+CQHTTP_MAX_CONNECTIONS = int(os.getenv("CQHTTP_MAX_CONNECTIONS", "10"))
+
+# 发送队列的后台任务数
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+
+# 单个群每秒最多发送的消息数，以及允许的突发条数（避免触发QQ风控）
+OUTBOX_GROUP_RATE = float(os.getenv("OUTBOX_GROUP_RATE", "1"))
+OUTBOX_GROUP_BURST = float(os.getenv("OUTBOX_GROUP_BURST", "3"))
+
+# 同一个群最多合并为一次发送的消息条数
+OUTBOX_MAX_BATCH = int(os.getenv("OUTBOX_MAX_BATCH", "5"))
+
+# 发送失败后的重试次数和首次重试等待时间（秒），之后每次翻倍
+OUTBOX_MAX_RETRIES = int(os.getenv("OUTBOX_MAX_RETRIES", "3"))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "1"))
+
+# 快速回复模式：命令的回复直接放在/event的响应中，由go-cqhttp代为发送
+QUICK_REPLY = os.getenv("QUICK_REPLY", "false").lower() in ("1", "true", "yes")
+
+# 开始提醒允许延迟的最长时间（秒），超过后不再补发
+NOTIFY_GRACE_SECONDS = int(os.getenv("NOTIFY_GRACE_SECONDS", "300"))
+
+# 每个队伍的人数上限
+TEAM_CAPACITY = int(os.getenv("TEAM_CAPACITY", "5"))
+
+# "车队 查询"每页显示的队伍数
+TEAM_PAGE_SIZE = int(os.getenv("TEAM_PAGE_SIZE", "10"))
+
+# 与go-cqhttp的通信方式：http（HTTP上报 + HTTP API）或 ws（反向WebSocket）
+ONEBOT_TRANSPORT = os.getenv("ONEBOT_TRANSPORT", "http").lower()
+
+# 反向WebSocket的access token，与go-cqhttp配置中的access-token一致，为空时不校验
+ONEBOT_ACCESS_TOKEN = os.getenv("ONEBOT_ACCESS_TOKEN", "")
+
+# 反向WebSocket断开时，发送消息最多等待go-cqhttp重连的时间（秒）
+ONEBOT_WS_RECONNECT_WAIT = float(os.getenv("ONEBOT_WS_RECONNECT_WAIT", "10"))
+
+# uvicorn工作进程数，大于1时多个进程共享同一个数据库
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# 调度器租约的有效期（秒），持有租约的进程每隔三分之一有效期续期一次
+SCHEDULER_LEASE_TTL = float(os.getenv("SCHEDULER_LEASE_TTL", "30"))
+
+# 多进程部署时，调度进程从数据库同步其他进程创建/删除的队伍提醒的间隔（秒）
+NOTIFY_SYNC_SECONDS = float(os.getenv("NOTIFY_SYNC_SECONDS", "5"))
+
+# 日志级别：DEBUG、INFO、WARNING、ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# 日志格式：json（每行一个JSON对象）或 text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# 高频的成功日志（例如每条消息发送成功）的采样比例，1表示全部输出
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1"))
+
+# 各服务器所在时区相对UTC的小时数，"车队 创建"输入的时间和队伍列表显示的时间都按服务器时区解释
+# 格式为"服务器=小时数"，用逗号分隔；未列出的服务器使用默认值
+SERVER_UTC_OFFSETS = {
+    "日服": 9.0,
+    "台服": 8.0,
+    "国服": 8.0,
+    "国际服": 0.0,
+    **{
+        server.strip(): float(hours)
+        for server, hours in (
+            item.split("=", 1) for item in os.getenv("SERVER_UTC_OFFSETS", "").split(",") if "=" in item
+        )
+    },
+}
+
+# 队伍在开始多久之后（秒）被清理，不会短于NOTIFY_GRACE_SECONDS，保证开始提醒发出前队伍还在
+TEAM_EXPIRE_AFTER_SECONDS = int(os.getenv("TEAM_EXPIRE_AFTER_SECONDS", "3600"))
+
+# 清理过期队伍的间隔（秒）以及每批最多删除的队伍数
+EXPIRY_SWEEP_SECONDS = float(os.getenv("EXPIRY_SWEEP_SECONDS", "60"))
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "200"))
+
+# 同一时刻多个群有队伍开始时，同时发送开始提醒的群数上限
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))
+
+# 识别重复投递的事件：最多记住的消息数和记录的有效期（秒）
+EVENT_DEDUP_SIZE = int(os.getenv("EVENT_DEDUP_SIZE", "10000"))
+EVENT_DEDUP_TTL = int(os.getenv("EVENT_DEDUP_TTL", "600"))
+
+# 同时把处理过的消息ID记录到数据库，多进程部署或重启后也能识别重复投递
+EVENT_DEDUP_PERSIST = os.getenv("EVENT_DEDUP_PERSIST", "false").lower() in ("1", "true", "yes")
+
+# 命令限流：每个用户、每个群在RATE_LIMIT_WINDOW秒内最多处理的命令数，0表示不限制
+RATE_LIMIT_WINDOW = float(os.getenv("RATE_LIMIT_WINDOW", "60"))
+RATE_LIMIT_USER = int(os.getenv("RATE_LIMIT_USER", "10"))
+RATE_LIMIT_GROUP = int(os.getenv("RATE_LIMIT_GROUP", "60"))
+
+# 限流器最多记录的用户或群数量，超出时淘汰最久没有发命令的
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+
+# 缓存的队伍列表回复数量上限，0表示不缓存
+LIST_REPLY_CACHE_SIZE = int(os.getenv("LIST_REPLY_CACHE_SIZE", "1000"))
+
+# 每个用户同时拥有的尚未开始的队伍数上限，0表示不限制
+MAX_OPEN_TEAMS_PER_CREATOR = int(os.getenv("MAX_OPEN_TEAMS_PER_CREATOR", "3"))
@@ -0,0 +1,46 @@
+import collections
+import time
+from typing import Any, OrderedDict, Tuple
+
+
+# 记录最近处理过的事件，用于识别go-cqhttp重复投递的同一条消息
+# 每个事件可以附带一个值（例如处理结果），重复投递时取出来使用
+# 按首次出现的时间顺序保存，过期和超出容量的记录都从最旧的一端删除，每次操作均摊O(1)
+class RecentEvents:
+    def __init__(self, maxsize: int = 10000, ttl: float = 600.0):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._seen: OrderedDict[str, Tuple[float, Any]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    # 第一次见到这个事件时记录（连同value）并返回True；有效期内再次出现时返回False
+    def claim(self, key: str, value: Any = None) -> bool:
+        now = time.monotonic()
+        self._expire(now)
+        if key in self._seen:
+            return False
+
+        self._seen[key] = (now, value)
+        if len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+        return True
+
+    # 取出事件附带的值，没有记录时返回None
+    def get(self, key: str) -> Any:
+        entry = self._seen.get(key)
+        return entry[1] if entry is not None else None
+
+    # 处理失败时撤销记录，让重新投递的事件可以再次处理
+    def release(self, key: str):
+        self._seen.pop(key, None)
+
+    def _expire(self, now: float):
+        deadline = now - self.ttl
+        seen = self._seen
+        while seen:
+            key, (first_seen, _) = next(iter(seen.items()))
+            if first_seen > deadline:
+                break
+            del seen[key]
@@ -0,0 +1,134 @@
+import contextlib
+import contextvars
+import datetime
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Optional
+
+from utils.config import LOG_FORMAT, LOG_LEVEL, LOG_SUCCESS_SAMPLE_RATE
+
+# 结构化日志：业务代码只把日志记录放进队列，由后台线程格式化并写到标准输出
+# 标准输出阻塞时（例如日志管道写满）不会卡住事件循环
+
+# 当前事件的关联ID，在routes.py中为每个事件设置，同一事件产生的日志带有相同的request_id
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+_request_ids = itertools.count(1)
+_request_id_prefix = f"{os.getpid():x}"
+
+# LogRecord自带的属性，其余属性视为通过extra传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+# 为一个事件生成新的关联ID，with块内产生的日志都带有这个ID
+@contextlib.contextmanager
+def request_context():
+    token = request_id_var.set(f"{_request_id_prefix}-{next(_request_ids)}")
+    try:
+        yield
+    finally:
+        request_id_var.reset(token)
+
+
+# 取得模块的logger，统一放在pjsk命名空间下
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"pjsk.{name}")
+
+
+# 附加关联ID；记录在入队前经过这里，所以取到的是产生日志的任务的上下文
+class _ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+# 按比例采样标记了sampled=True的日志（例如每条消息的发送成功），其余日志全部保留
+class _SuccessSampler(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+# 每条日志输出为一行JSON，extra中的字段原样带出
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != "sampled" and value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# 便于直接阅读的单行文本格式，extra中的字段以key=value附在后面
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("[%(asctime)s] %(levelname)s %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = " ".join(
+            f"{key}={value}" for key, value in vars(record).items()
+            if key not in _RECORD_ATTRS and key != "sampled" and value is not None
+        )
+        return f"{text} {fields}" if fields else text
+
+
+# QueueHandler默认会在入队前把消息格式化成字符串并丢掉args，这里保留原始记录，格式化全部交给后台线程
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            # 异常对象可能在后台线程处理前被修改，提前生成文本
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+
+# 配置日志（在应用启动前调用，重复调用无效）
+def setup_logging():
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(_SuccessSampler(LOG_SUCCESS_SAMPLE_RATE))
+    queue_handler.addFilter(_ContextFilter())
+
+    logger = logging.getLogger("pjsk")
+    logger.setLevel(LOG_LEVEL)
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+
+# 写完队列中剩余的日志并停止后台线程（在应用关闭时调用）
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
@@ -0,0 +1,191 @@
+import bisect
+import contextlib
+import functools
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 进程内的Prometheus风格指标，由GET /metrics以文本格式导出
+# 多进程部署时每个进程各自统计，一次抓取只能看到处理该请求的进程
+
+# 默认的耗时分桶（秒），覆盖缓存命中的微秒级到发送超时的十秒级
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.append(self)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+# 只增不减的计数器
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def _samples(self) -> Iterator[str]:
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+# 抓取时通过回调取值的仪表，回调返回None时不输出
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._function: Optional[Callable[[], Optional[float]]] = None
+
+    def set_function(self, function: Callable[[], Optional[float]]):
+        self._function = function
+
+    def _samples(self) -> Iterator[str]:
+        value = self._function() if self._function is not None else None
+        if value is not None:
+            yield f"{self.name} {_format_value(value)}"
+
+
+# 直方图：每个分桶只记录落在其中的次数，导出时再累加成Prometheus的累计分桶
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶次数..., 超出最大分桶的次数], 总和
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        entry = self._values.get(labelvalues)
+        if entry is None:
+            entry = self._values[labelvalues] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    # 统计with块的耗时
+    @contextlib.contextmanager
+    def time(self, *labelvalues: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        entry = self._values.get(labelvalues)
+        return sum(entry[0]) if entry is not None else 0
+
+    # 每组标签值的观测次数
+    def counts(self) -> Dict[LabelValues, int]:
+        return {labelvalues: sum(counts) for labelvalues, (counts, _) in self._values.items()}
+
+    def _samples(self) -> Iterator[str]:
+        names = self.labelnames + ("le",)
+        for labelvalues, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(names, labelvalues + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(total[0])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+# 统计异步函数每次调用的耗时，以函数名作为标签
+def timed(histogram: Histogram):
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# 所有已注册的指标，按注册顺序导出
+registry: List[_Metric] = []
+
+
+# 以Prometheus文本格式导出所有指标
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+# 热点路径上的指标
+
+EVENT_SECONDS = Histogram(
+    "pjsk_event_seconds", "处理一个go-cqhttp事件的耗时（秒），按命令区分", ("command",))
+
+DB_CALL_SECONDS = Histogram(
+    "pjsk_db_call_seconds", "team_submitter.database中各函数的调用耗时（秒）", ("function",))
+
+SEND_SECONDS = Histogram(
+    "pjsk_send_seconds", "send_group_message的调用耗时（秒），按结果区分", ("result",))
+
+SEND_TOTAL = Counter(
+    "pjsk_send_total", "send_group_message的调用次数，按结果区分", ("result",))
+
+DUPLICATE_EVENTS = Counter(
+    "pjsk_duplicate_events_total", "被识别为重复投递而跳过的事件数")
+
+RATE_LIMITED = Counter(
+    "pjsk_rate_limited_total", "因发送命令过于频繁而被忽略的事件数，按限流对象区分", ("scope",))
+
+REPLY_CACHE_TOTAL = Counter(
+    "pjsk_reply_cache_total", "队伍列表回复缓存的查找次数，按是否命中区分", ("result",))
+
+JOB_SECONDS = Histogram(
+    "pjsk_scheduler_job_seconds", "定时任务的执行耗时（秒）", ("job",))
+
+NOTIFY_LAG_SECONDS = Histogram(
+    "pjsk_notify_lag_seconds", "开始提醒加入发送队列时距队伍开始时间的延迟（秒）",
+    buckets=(0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+
+ACTIVE_TEAMS = Gauge("pjsk_active_teams", "当前的队伍数")
+
+ACTIVE_MEMBERS = Gauge("pjsk_active_members", "当前所有队伍的成员总数")
+
+OUTBOX_DEPTH = Gauge("pjsk_outbox_depth", "发送队列中等待发送的消息数")
@@ -0,0 +1,233 @@
+import asyncio
+import collections
+import time
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from utils.config import (
+    OUTBOX_GROUP_BURST,
+    OUTBOX_GROUP_RATE,
+    OUTBOX_MAX_BATCH,
+    OUTBOX_MAX_RETRIES,
+    OUTBOX_RETRY_BASE_DELAY,
+    OUTBOX_WORKERS,
+)
+from utils.log import get_logger
+from utils.metrics import OUTBOX_DEPTH
+from utils.sender import send_group_message
+
+logger = get_logger("outbox")
+
+
+# 令牌桶，限制单个群的发送频率
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    # 取走一个令牌，返回需要等待的秒数（0表示可以立即发送）
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+# 一条待发送的消息：(内容, 入队时间, 发送结果)
+PendingMessage = Tuple[str, float, asyncio.Future]
+
+
+# 进程内的发送队列：处理函数只负责入队，后台任务按群限速、合并并重试发送
+class OutboundQueue:
+    def __init__(
+        self,
+        worker_count: int = 4,
+        group_rate: float = 1.0,
+        group_burst: float = 3.0,
+        max_batch: int = 5,
+        max_retries: int = 3,
+        retry_base_delay: float = 1.0,
+    ):
+        self.worker_count = max(1, worker_count)
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_batch = max(1, max_batch)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+        self._ready: Optional[asyncio.Queue] = None  # 有待发送消息的群ID
+        self._pending: Dict[str, List[PendingMessage]] = {}
+        self._in_flight: Set[str] = set()  # 正在被某个任务处理的群
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._workers: List[asyncio.Task] = []
+
+        # 统计信息
+        self._sent = 0
+        self._failed = 0
+        self._retries = 0
+        self._coalesced = 0
+        self._latencies: Deque[float] = collections.deque(maxlen=1000)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    # 启动后台发送任务（在应用启动时调用）
+    def start(self):
+        if self.running:
+            return
+        self._ready = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"outbox-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        # 启动前积压的消息
+        for group_id in self._pending:
+            self._ready.put_nowait(group_id)
+
+    # 等待队列中的消息全部发完，最多等待timeout秒，返回是否已发完
+    async def drain(self, timeout: float = 5.0) -> bool:
+        if not self.running:
+            return not self._pending
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # 停止后台任务，最多等待timeout秒把剩余消息发完（在应用关闭时调用）
+    async def stop(self, timeout: float = 5.0):
+        if not self.running:
+            return
+        await self.drain(timeout)
+
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        # 未发出的消息视为发送失败
+        for messages in self._pending.values():
+            for _, _, future in messages:
+                if not future.done():
+                    future.set_result(False)
+        self._pending.clear()
+        self._in_flight.clear()
+
+    # 消息入队，立即返回；返回的Future在消息发出后得到发送结果
+    def enqueue(self, group_id: str, message: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        messages = self._pending.setdefault(group_id, [])
+        messages.append((message, time.monotonic(), future))
+
+        # 同一个群只排队一次，正在发送的群由处理它的任务在发送后重新排队
+        if self.running and len(messages) == 1 and group_id not in self._in_flight:
+            self._ready.put_nowait(group_id)
+        return future
+
+    # 待发送的消息数
+    @property
+    def depth(self) -> int:
+        return sum(len(messages) for messages in self._pending.values())
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 4)
+
+        return {
+            "running": self.running,
+            "depth": self.depth,
+            "groups_pending": len(self._pending),
+            "sent": self._sent,
+            "failed": self._failed,
+            "retries": self._retries,
+            "coalesced": self._coalesced,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+            "latency_max": round(latencies[-1], 4) if latencies else None,
+        }
+
+    async def _worker(self):
+        while True:
+            group_id = await self._ready.get()
+            self._in_flight.add(group_id)
+            try:
+                await self._send_group(group_id)
+            except Exception:
+                logger.exception("发送队列处理群消息时发生未知错误", extra={"group_id": group_id})
+            finally:
+                self._in_flight.discard(group_id)
+                # 发送期间又有新消息，重新排队
+                if group_id in self._pending:
+                    self._ready.put_nowait(group_id)
+                self._ready.task_done()
+
+    async def _send_group(self, group_id: str):
+        bucket = self._buckets.get(group_id)
+        if bucket is None:
+            bucket = self._buckets[group_id] = TokenBucket(self.group_rate, self.group_burst)
+
+        # 等待令牌期间到达的消息也会被合并进这一批
+        delay = bucket.take()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        pending = self._pending.pop(group_id, [])
+        if not pending:
+            return
+        batch, rest = pending[:self.max_batch], pending[self.max_batch:]
+        if rest:
+            self._pending[group_id] = rest
+
+        # 合并同一群的多条消息为一次发送
+        text = "\n\n".join(message for message, _, _ in batch)
+        self._coalesced += len(batch) - 1
+
+        success = False
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._retries += 1
+                await asyncio.sleep(self.retry_base_delay * 2 ** (attempt - 1))
+            if await send_group_message(group_id, text):
+                success = True
+                break
+
+        now = time.monotonic()
+        for _, enqueued_at, future in batch:
+            self._latencies.append(now - enqueued_at)
+            if not future.done():
+                future.set_result(success)
+
+        if success:
+            self._sent += len(batch)
+        else:
+            self._failed += len(batch)
+            logger.error("重试%d次后仍无法发送消息，已丢弃%d条", self.max_retries, len(batch),
+                         extra={"group_id": group_id})
+
+
+# 全局发送队列
+outbox = OutboundQueue(
+    worker_count=OUTBOX_WORKERS,
+    group_rate=OUTBOX_GROUP_RATE,
+    group_burst=OUTBOX_GROUP_BURST,
+    max_batch=OUTBOX_MAX_BATCH,
+    max_retries=OUTBOX_MAX_RETRIES,
+    retry_base_delay=OUTBOX_RETRY_BASE_DELAY,
+)
+OUTBOX_DEPTH.set_function(lambda: outbox.depth)
+
+
+# 将群消息加入发送队列；队列未启动时直接发送
+def enqueue_group_message(group_id: str, message: str) -> asyncio.Future:
+    if not outbox.running:
+        return asyncio.ensure_future(send_group_message(group_id, message))
+    return outbox.enqueue(group_id, message)
@@ -0,0 +1,44 @@
+import collections
+import time
+from typing import List, OrderedDict
+
+
+# 滑动窗口限流：按key（用户或群）统计最近window秒内的请求数，超过limit时拒绝
+# 使用滑动窗口计数的近似算法，每个key只保存当前和上一个固定窗口的计数，每次检查O(1)
+# 最多记录maxsize个key，超出时淘汰最久没有请求的key；limit为0时不限流
+class SlidingWindowLimiter:
+    def __init__(self, limit: int, window: float = 60.0, maxsize: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.maxsize = max(1, maxsize)
+        # key -> [窗口序号, 当前窗口计数, 上一个窗口计数]，按最近请求时间排序
+        self._windows: OrderedDict[str, List[int]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    # 记录一次请求，未超过限制时返回True；被拒绝的请求不计数
+    def allow(self, key: str) -> bool:
+        if self.limit <= 0:
+            return True
+
+        position = time.monotonic() / self.window
+        index = int(position)
+        state = self._windows.get(key)
+        if state is None:
+            state = self._windows[key] = [index, 0, 0]
+            if len(self._windows) > self.maxsize:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(key)
+            if state[0] != index:
+                # 进入新窗口：紧挨着的上一个窗口的计数保留下来，更早的清零
+                state[2] = state[1] if state[0] == index - 1 else 0
+                state[1] = 0
+                state[0] = index
+
+        # 上一个窗口的计数按仍落在滑动窗口内的比例折算
+        if state[2] * (1 - (position - index)) + state[1] >= self.limit:
+            return False
+        state[1] += 1
+        return True
@@ -1,38 +1,91 @@
+import asyncio
+import time
+from typing import Optional
+
 import httpx
 
+from utils.config import CQHTTP_API_URL, CQHTTP_MAX_CONNECTIONS, CQHTTP_TIMEOUT, ONEBOT_TRANSPORT
+from utils.log import get_logger
+from utils.metrics import SEND_SECONDS, SEND_TOTAL
+from utils.ws_transport import onebot_ws
+
+logger = get_logger("sender")
+
+# 应用生命周期内共享的HTTP客户端，复用到go-cqhttp的长连接
+_client: Optional[httpx.AsyncClient] = None
+
+
+# 创建共享客户端（在应用启动时调用）
+async def init_sender():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=CQHTTP_API_URL,
+            timeout=CQHTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=CQHTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=CQHTTP_MAX_CONNECTIONS,
+                keepalive_expiry=30.0
+            )
+        )
+
+
+# 关闭共享客户端（在应用关闭时调用）
+async def close_sender():
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
 # 发送群消息的函数（调用go-cqhttp的API
 
 
 async def send_group_message(group_id: str, message: str) -> bool:
-    # 使用异步HTTP客户端
-    # 设置go-cqhttp的API基础URL
-    base_send_url = "http://127.0.0.1:3000"  # 默认地址，可根据实际配置修改
+    started = time.perf_counter()
+    success = await _send_group_message(group_id, message)
+
+    # 按发送结果统计次数和耗时
+    result = "success" if success else "failure"
+    SEND_SECONDS.observe(time.perf_counter() - started, result)
+    SEND_TOTAL.inc(result)
+    return success
+
+
+async def _send_group_message(group_id: str, message: str) -> bool:
+    params = {
+        # 确保group_id格式正确
+        "group_id": int(group_id) if group_id.isdigit() else group_id,
+        "message": message
+    }
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        if ONEBOT_TRANSPORT == "ws":
+            # 通过反向WebSocket调用API
+            result = await onebot_ws.call_api("send_group_msg", params, timeout=CQHTTP_TIMEOUT)
+        else:
+            # 未经过应用启动流程（例如单独调用）时按需创建客户端
+            if _client is None:
+                await init_sender()
+
             # 发送POST请求到go-cqhttp的API
-            response = await client.post(
-                f"{base_send_url}/send_group_msg",
-                json={
-                    # 确保group_id格式正确
-                    "group_id": int(group_id) if group_id.isdigit() else group_id,
-                    "message": message
-                }
-            )
+            response = await _client.post("/send_group_msg", json=params)
 
             # 检查响应状态
             response.raise_for_status()
             result = response.json()
 
-            if result.get("status") == "ok" or result.get("retcode") == 0:
-                print(f"成功发送群消息到 {group_id}: {message}")
-                return True
-            else:
-                print(f"发送群消息失败: {result}")
-                return False
-    except (httpx.RequestError, httpx.HTTPStatusError) as e:
-        print(f"发送群消息时发生错误: {str(e)}")
+        if result.get("status") == "ok" or result.get("retcode") == 0:
+            # 成功日志量大，只记录长度并按比例采样，消息内容只在DEBUG级别输出
+            logger.info("成功发送群消息", extra={"group_id": group_id, "length": len(message), "sampled": True})
+            logger.debug("群消息内容: %s", message, extra={"group_id": group_id})
+            return True
+        else:
+            logger.warning("发送群消息失败", extra={"group_id": group_id, "result": result})
+            return False
+    except (httpx.RequestError, httpx.HTTPStatusError, ConnectionError, asyncio.TimeoutError) as e:
+        logger.warning("发送群消息时发生错误: %s", e, extra={"group_id": group_id, "error": type(e).__name__})
         return False
-    except Exception as e:
-        print(f"发送群消息时发生未知错误: {str(e)}")
+    except Exception:
+        logger.exception("发送群消息时发生未知错误", extra={"group_id": group_id})
         return False
@@ -0,0 +1,149 @@
+import asyncio
+import itertools
+import json
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from utils.config import ONEBOT_WS_RECONNECT_WAIT
+from utils.log import get_logger
+
+# orjson解析速度更快，未安装时退回标准库
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# 处理go-cqhttp推送的事件，参数是原始的消息内容
+# 需要进一步处理时返回一个awaitable，会在单独的任务中执行；可以忽略的事件返回None
+EventHandler = Callable[[bytes], Optional[Awaitable]]
+
+logger = get_logger("ws")
+
+
+# go-cqhttp的反向WebSocket连接：事件和API调用共用同一个连接
+# API调用通过echo字段匹配请求和响应
+class ReverseWebSocket:
+    def __init__(self, reconnect_wait: float = 10.0):
+        # 连接断开时，API调用最多等待go-cqhttp重连的时间（秒）
+        self.reconnect_wait = reconnect_wait
+        self._websocket: Optional[WebSocket] = None
+        self._connected_event: Optional[asyncio.Event] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._echo_counter = itertools.count(1)
+        self._event_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def connected(self) -> bool:
+        return self._websocket is not None
+
+    # 在事件循环中按需创建，避免在导入时绑定到错误的事件循环
+    @property
+    def _connected(self) -> asyncio.Event:
+        if self._connected_event is None:
+            self._connected_event = asyncio.Event()
+        return self._connected_event
+
+    # 处理一个go-cqhttp连接，直到连接断开
+    async def serve(self, websocket: WebSocket, on_event: EventHandler):
+        await websocket.accept()
+
+        # go-cqhttp重连时旧连接可能还没被发现断开，直接用新连接替换
+        previous = self._websocket
+        self._websocket = websocket
+        self._connected.set()
+        if previous is not None:
+            await self._close_quietly(previous)
+        logger.info("go-cqhttp已通过WebSocket连接", extra={"self_id": websocket.headers.get("x-self-id")})
+
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes") or (message.get("text") or "").encode("utf-8")
+                self._dispatch(data, on_event)
+        except (WebSocketDisconnect, RuntimeError):
+            # 被新连接替换后旧连接已关闭，继续receive会抛出RuntimeError
+            pass
+        finally:
+            # 只有当前连接断开时才清理，已被新连接替换的旧连接不影响新连接
+            if self._websocket is websocket:
+                self._websocket = None
+                self._connected.clear()
+                self._fail_pending(ConnectionError("go-cqhttp WebSocket连接已断开"))
+            logger.warning("go-cqhttp的WebSocket连接已断开")
+
+    def _dispatch(self, data: bytes, on_event: EventHandler):
+        # API调用的响应带有echo字段，事件没有
+        if b'"echo"' in data:
+            try:
+                payload = json_loads(data)
+            except ValueError:
+                return
+            echo = payload.get("echo") if isinstance(payload, dict) else None
+            future = self._pending.pop(str(echo), None) if echo is not None else None
+            if future is not None:
+                if not future.done():
+                    future.set_result(payload)
+                return
+
+        work = on_event(data)
+        if work is None:
+            return
+
+        # 事件在单独的任务中处理，不阻塞接收API响应
+        task = asyncio.ensure_future(work)
+        self._event_tasks.add(task)
+        task.add_done_callback(self._event_tasks.discard)
+
+    # 通过WebSocket调用go-cqhttp的API，返回响应内容
+    async def call_api(self, action: str, params: dict, timeout: float = 10.0) -> dict:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        # 连接断开时等待go-cqhttp自动重连
+        if self._websocket is None:
+            try:
+                await asyncio.wait_for(self._connected.wait(), min(self.reconnect_wait, timeout))
+            except asyncio.TimeoutError:
+                pass
+        websocket = self._websocket
+        if websocket is None:
+            raise ConnectionError("go-cqhttp未通过WebSocket连接")
+
+        echo = str(next(self._echo_counter))
+        future = loop.create_future()
+        self._pending[echo] = future
+        try:
+            await websocket.send_text(json.dumps(
+                {"action": action, "params": params, "echo": echo}, ensure_ascii=False))
+            return await asyncio.wait_for(future, max(0.0, deadline - loop.time()))
+        finally:
+            self._pending.pop(echo, None)
+
+    def _fail_pending(self, error: Exception):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    # 关闭当前连接（在应用关闭时调用）
+    async def close(self):
+        websocket, self._websocket = self._websocket, None
+        self._connected.clear()
+        self._fail_pending(ConnectionError("应用正在关闭"))
+        if websocket is not None:
+            await self._close_quietly(websocket)
+
+
+# 全局的反向WebSocket连接
+onebot_ws = ReverseWebSocket(reconnect_wait=ONEBOT_WS_RECONNECT_WAIT)